@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SHA-256 avalanche analyzer ("Hello" / "hello" / "hello!" at scale)
+- For N random inputs, flips every input bit and hashes all variants in NumPy lanes
+  on the vectorized engine of hash_demo.py.
+- Measures the flip probability of every output bit, the input-bit x output-bit
+  flip matrix (strict avalanche criterion) and the Hamming-distance histogram.
+- Writes JSON and a PNG heatmap of the matrix (no plotting library needed) that the
+  Manim scenes can load with ImageMobject.
+"""
+
+import argparse
+import hashlib
+import json
+import struct
+import sys
+import time
+import zlib
+
+import hash_demo as hd
+
+np = hd.load_numpy()
+
+# --- Hashing -------------------------------------------------------------------------
+def sha256_words_np(messages):
+    """(M, L) uint8 messages of one length -> (M, 32) uint8 digests, on hash_demo's NumPy engine."""
+    count, length = messages.shape
+    padding = np.frombuffer(hd.sha256_padding(length), dtype=np.uint8)
+    padded = np.empty((count, length + len(padding)), dtype=np.uint8)
+    padded[:, :length] = messages
+    padded[:, length:] = padding
+    words = padded.view(">u4").astype(np.uint32).reshape(count, -1, 16)
+    H = np.repeat(hd._H_INIT_NP[:, None], count, axis=1)
+    for blk in range(words.shape[1]):
+        H = hd.compress_blocks_np(H, np.ascontiguousarray(words[:, blk, :].T))
+    return np.ascontiguousarray(H.T, dtype=">u4").view(np.uint8).reshape(count, 32)
+
+def analyze(inputs: int, length: int, lanes: int = 65536, seed: int = None) -> dict:
+    """Flip each of the 8*length input bits of `inputs` random messages and tally output flips."""
+    rng = np.random.default_rng(seed)
+    nbits = 8 * length
+    per_input = nbits + 1  # the message itself, then one variant per flipped bit
+    batch = max(1, lanes // per_input)
+    flips = np.eye(nbits, dtype=np.uint8).reshape(nbits, length, 8)
+    flips = np.packbits(flips, axis=-1).reshape(nbits, length)  # bit j -> byte j//8, MSB first
+
+    counts = np.zeros((nbits, 256), dtype=np.int64)
+    hamming = np.zeros(257, dtype=np.int64)
+    checked = False
+    start = time.perf_counter()
+    for lo in range(0, inputs, batch):
+        n = min(batch, inputs - lo)
+        base = rng.integers(0, 256, size=(n, length), dtype=np.uint8)
+        variants = np.empty((n, per_input, length), dtype=np.uint8)
+        variants[:, 0] = base
+        variants[:, 1:] = base[:, None, :] ^ flips[None]
+        digests = sha256_words_np(variants.reshape(-1, length)).reshape(n, per_input, 32)
+        if not checked:
+            for i in range(min(n, 4)):
+                if digests[i, 0].tobytes() != hashlib.sha256(base[i].tobytes()).digest():
+                    raise RuntimeError("NumPy engine disagrees with hashlib")
+            checked = True
+        diff = np.unpackbits(digests[:, 1:] ^ digests[:, :1], axis=-1)  # (n, nbits, 256)
+        counts += diff.sum(axis=0, dtype=np.int64)
+        hamming += np.bincount(diff.sum(axis=-1, dtype=np.int64).ravel(), minlength=257)
+    elapsed = time.perf_counter() - start
+
+    trials = inputs * nbits
+    sac = counts / max(1, inputs)
+    distances = np.arange(257)
+    mean = float((hamming * distances).sum() / max(1, trials))
+    var = float((hamming * (distances - mean) ** 2).sum() / max(1, trials))
+    hashes = inputs * per_input
+    return {
+        "inputs": inputs,
+        "input_bytes": length,
+        "hashes": hashes,
+        "seconds": elapsed,
+        "hashes_per_second": hashes / elapsed if elapsed > 0 else None,
+        "hamming_mean": mean,
+        "hamming_std": var ** 0.5,
+        "hamming_histogram": hamming.tolist(),
+        "output_bit_flip_probability": (counts.sum(axis=0) / max(1, trials)).round(6).tolist(),
+        "sac_max_deviation": float(np.abs(sac - 0.5).max()) if inputs else None,
+        "sac_matrix": sac.round(4).tolist()
+    }
+
+# --- Heatmap ---------------------------------------------------------------------------
+def _png(pixels) -> bytes:
+    """Encode an (H, W, 3) uint8 array as a PNG."""
+    height, width, _ = pixels.shape
+    raw = b"".join(b"\0" + pixels[y].tobytes() for y in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 9)) + chunk(b"IEND", b"")
+
+def write_heatmap(path: str, sac, spread: float = 0.1, cell: int = 2):
+    """Input bits down, output bits across; white = 0.5, blue below, red above (clipped at +-spread)."""
+    t = np.clip((np.asarray(sac) - 0.5) / spread, -1.0, 1.0)
+    r = np.where(t < 0, 1 + t, 1.0)
+    b = np.where(t > 0, 1 - t, 1.0)
+    g = 1 - np.abs(t)
+    pixels = (np.stack([r, g, b], axis=-1) * 255).round().astype(np.uint8)
+    pixels = pixels.repeat(cell, axis=0).repeat(cell, axis=1)
+    with open(path, "wb") as fh:
+        fh.write(_png(pixels))
+
+# --- CLI ---------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Measure SHA-256's avalanche effect with NumPy.")
+    parser.add_argument("--inputs", type=int, default=2000,
+                        help="Random base inputs (default: 2000); each is hashed 8*length+1 times.")
+    parser.add_argument("--length", type=int, default=16,
+                        help="Input length in bytes (default: 16).")
+    parser.add_argument("--lanes", type=int, default=65536,
+                        help="Messages hashed per NumPy call (default: 65536).")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="RNG seed for reproducible inputs.")
+    parser.add_argument("--json", default="avalanche.json",
+                        help="JSON output path ('-' for stdout; default: avalanche.json).")
+    parser.add_argument("--heatmap", default="avalanche.png",
+                        help="PNG heatmap of the input x output bit flip matrix ('' to skip).")
+    parser.add_argument("--spread", type=float, default=0.1,
+                        help="Heatmap color range around 0.5 (default: 0.1).")
+    parser.add_argument("--cell", type=int, default=2,
+                        help="Heatmap pixels per matrix cell (default: 2).")
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error("NumPy is required (pip install numpy)")
+    if args.inputs < 1 or args.length < 1:
+        parser.error("--inputs and --length must be at least 1")
+
+    result = analyze(args.inputs, args.length, args.lanes, args.seed)
+    text = json.dumps(result)
+    if args.json == "-":
+        print(text)
+    else:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    if args.heatmap:
+        write_heatmap(args.heatmap, result["sac_matrix"], args.spread, max(1, args.cell))
+
+    rate = result["hashes_per_second"] or float("inf")
+    print(f"{result['hashes']:,} hashes in {result['seconds']:.2f} s ({rate:,.0f} hashes/s); "
+          f"Hamming distance {result['hamming_mean']:.2f} ± {result['hamming_std']:.2f} of 256, "
+          f"max SAC deviation {result['sac_max_deviation']:.4f}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SHA-256 engine benchmarks for hash_demo.py
+- Times sha256_pad, extend_schedule, compress_block and the full digest path.
+- Input sizes from 0 B to 64 MB, tracing on and off, hashlib.sha256 as baseline.
+- Appends every run to a JSON history file and fails on regressions.
+- --startup checks every entry point's import time against a budget instead.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import hash_demo as hd
+
+DEFAULT_SIZES = [0, 55, 64, 1 << 10, 64 << 10, 1 << 20, 16 << 20, 64 << 20]
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for suffix, mult in (("K", 1 << 10), ("M", 1 << 20), ("G", 1 << 30)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * mult)
+    return int(text)
+
+def time_call(fn, min_time: float) -> float:
+    """Best seconds-per-call over repeated runs lasting at least min_time in total."""
+    best = float("inf")
+    spent = 0.0
+    calls = 0
+    while spent < min_time or calls == 0:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        calls += 1
+    return best
+
+def _consume(events):
+    for _ in events:
+        pass
+
+# --- Cases --------------------------------------------------------------------
+def micro_cases():
+    W16 = list(range(16))
+    W = hd.extend_schedule(W16)
+    H = hd.H_INIT[:]
+    return [
+        ("extend_schedule", 64, lambda: hd.extend_schedule(W16)),
+        ("extend_schedule_loop", 64, lambda: hd.extend_schedule_loop(W16)),
+        ("compress_block/trace=off", 64, lambda: hd.compress_block(H, W, 0)),
+        ("compress_block/trace=64", 64, lambda: hd.compress_block(H, W, 64)),
+        ("compress_block_loop/trace=off", 64, lambda: hd.compress_block_loop(H, W, 0)),
+    ]
+
+def size_cases(sizes):
+    for size in sizes:
+        data = os.urandom(size)
+        yield (f"sha256_pad/{size}", size, lambda d=data: hd.sha256_pad(d))
+        yield (f"hashlib/{size}", size, lambda d=data: hashlib.sha256(d).digest())
+        yield (f"digest/trace=off/{size}", size,
+               lambda d=data: hd.digest_sha256_with_logs(d, rounds_to_log=0, blocks=()))
+        yield (f"digest/trace=on/{size}", size,
+               lambda d=data: _consume(hd.iter_block_events(d, blocks=None, rounds=range(64))))
+
+def run_cases(cases, min_time: float, verbose: bool = True) -> dict:
+    results = {}
+    for name, nbytes, fn in cases:
+        seconds = time_call(fn, min_time)
+        mb_s = nbytes / seconds / 1e6 if nbytes and seconds > 0 else None
+        results[name] = {"seconds": seconds, "bytes": nbytes, "mb_s": mb_s}
+        if verbose:
+            rate = f"{mb_s:10.2f} MB/s" if mb_s is not None else " " * 15
+            print(f"{name:40s} {seconds * 1e6:14.1f} us {rate}", flush=True)
+    return results
+
+# --- Startup budgets (-X importtime) -------------------------------------------
+# Import time of each entry point, summed over the top-level modules that
+# `python -X importtime` reports while the command runs (lazy imports count once
+# they are triggered). Budgets are milliseconds on a typical dev machine; use
+# --budget-scale on slower hosts. hash_demo runs as -m so its own bytecode
+# comes from __pycache__ like any other import. The tools import
+# concurrent.futures up front because their only real path is the process pool.
+STARTUP_CASES = [
+    ("hash_demo --plain", ["-m", "hash_demo", "--plain", "--delay", "0", "--rounds", "0", "--no-schedule", "abc"], 50),
+    ("hash_demo (rich)", ["-m", "hash_demo", "--delay", "0", "--rounds", "0", "--no-schedule", "abc"], 120),
+    ("hash_demo --diff", ["-m", "hash_demo", "--plain", "--delay", "0", "--rounds", "0", "--diff", "a", "b"], 50),
+    ("hash_table --help", ["hash_table.py", "--help"], 100),
+    ("hash_crack --help", ["hash_crack.py", "--help"], 100),
+    ("hash_collide --help", ["hash_collide.py", "--help"], 100),
+    ("hash_avalanche --help", ["hash_avalanche.py", "--help"], 200),  # needs NumPy up front
+]
+
+def parse_importtime(stderr: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """(total ms of top-level imports, [(ms, module)] heaviest first) from -X importtime output."""
+    top = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # the column header
+        name = name[1:]  # nested imports are indented by two more spaces per level
+        if not name.startswith(" "):
+            top.append((int(cumulative) / 1000, name.strip()))
+    top.sort(reverse=True)
+    return sum(ms for ms, _ in top), top
+
+def measure_startup(argv: List[str], runs: int) -> Tuple[float, float, List[Tuple[float, str]]]:
+    """Best-of-runs (import ms, wall ms, heaviest imports) for `python -X importtime *argv`."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=here, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        wall = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} exited with {proc.returncode}")
+        total, top = parse_importtime(proc.stderr)
+        if best is None or total < best[0]:
+            best = (total, wall, top)
+    return best
+
+def run_startup(runs: int, scale: float) -> list:
+    """Print import time per entry point; returns the cases over budget."""
+    over = []
+    print(f"{'entry point':24s} {'imports':>10s} {'budget':>8s} {'wall':>9s}  heaviest imports")
+    for name, argv, budget in STARTUP_CASES:
+        total, wall, top = measure_startup(argv, runs)
+        limit = budget * scale
+        heaviest = ", ".join(f"{mod} {ms:.1f}" for ms, mod in top[:3])
+        flag = "" if total <= limit else "  OVER"
+        print(f"{name:24s} {total:7.1f} ms {limit:5.0f} ms {wall:6.1f} ms  {heaviest}{flag}", flush=True)
+        if total > limit:
+            over.append((name, total, limit))
+    return over
+
+# --- History / regressions ----------------------------------------------------
+def machine_id() -> str:
+    return f"{platform.node()}/{platform.machine()}/{platform.python_implementation()}-{platform.python_version()}"
+
+def load_history(path: str) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+def save_history(path: str, history: list):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(history, fh, indent=1)
+    os.replace(tmp, path)
+
+def find_regressions(results: dict, history: list, threshold: float, window: int) -> list:
+    """Cases slower than the median of the last `window` comparable runs by more than threshold."""
+    same_machine = [run for run in history if run.get("machine") == machine_id()][-window:]
+    regressions = []
+    for name, res in results.items():
+        past = [run["results"][name]["seconds"] for run in same_machine if name in run["results"]]
+        if not past:
+            continue
+        baseline = statistics.median(past)
+        ratio = res["seconds"] / baseline if baseline > 0 else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((name, baseline, res["seconds"], ratio))
+    return regressions
+
+# --- CLI ----------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hash_demo.py SHA-256 engine.")
+    parser.add_argument("--sizes", default=None,
+                        help="Comma-separated input sizes, e.g. 0,1K,1M,64M (default: 0 B .. 64 MB).")
+    parser.add_argument("--max-size", default="64M",
+                        help="Skip default sizes above this (default: 64M).")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="Minimum total seconds spent per case (default: 0.2).")
+    parser.add_argument("--history", default="hash_bench_history.json",
+                        help="JSON history file to compare against and append to.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed slowdown vs. the recent median before failing (default: 0.10 = 10%%).")
+    parser.add_argument("--window", type=int, default=5,
+                        help="How many previous runs on this machine form the baseline (default: 5).")
+    parser.add_argument("--no-save", action="store_true",
+                        help="Do not append this run to the history file.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Instead of the engine cases, check each entry point's import time "
+                             "(python -X importtime) against its budget.")
+    parser.add_argument("--startup-runs", type=int, default=5,
+                        help="Runs per entry point for --startup; the fastest counts (default: 5).")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every --startup budget, e.g. 2 on a slow machine (default: 1).")
+    args = parser.parse_args()
+
+    if args.startup:
+        over = run_startup(args.startup_runs, args.budget_scale)
+        if over:
+            print(f"\n{len(over)} entry point(s) over budget:")
+            for name, total, limit in over:
+                print(f"  {name}: {total:.1f} ms > {limit:.0f} ms")
+            sys.exit(1)
+        print("\nAll entry points within budget.")
+        return
+
+    if args.sizes:
+        sizes = [parse_size(x) for x in args.sizes.split(",") if x.strip()]
+    else:
+        limit = parse_size(args.max_size)
+        sizes = [s for s in DEFAULT_SIZES if s <= limit]
+
+    results = run_cases(list(micro_cases()), args.min_time)
+    results.update(run_cases(size_cases(sizes), args.min_time))
+
+    history = load_history(args.history)
+    regressions = find_regressions(results, history, args.threshold, args.window)
+    if not args.no_save:
+        history.append({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": machine_id(),
+            "results": results
+        })
+        save_history(args.history, history)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for name, before, now, ratio in regressions:
+            print(f"  {name}: {before * 1e6:.1f} us -> {now * 1e6:.1f} us ({ratio:.2f}x)")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
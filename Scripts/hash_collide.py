@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Birthday collisions on SHA-256 truncated to k bits (the bound 256.py never shows)
+- f(x) = first k bits of SHA-256(x as 8 bytes) is iterated from random starts until a
+  "distinguished point" (low d bits zero) is reached; only (start, point, length)
+  is kept, so memory is ~work / 2^d entries instead of one per hash.
+- Trails are walked in parallel worker processes (van Oorschot-Wiener); two trails
+  ending in the same point have merged, and re-walking them yields the collision.
+- Measured work is reported against the birthday prediction sqrt(pi/2 * 2^k).
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import hash_demo as hd
+
+MAX_BITS = 64
+
+# --- Truncated hash ----------------------------------------------------------------
+def truncated_sha256(x: int, bits: int) -> int:
+    return int.from_bytes(hashlib.sha256(x.to_bytes(8, "big")).digest()[:8], "big") >> (64 - bits)
+
+def default_dp_bits(bits: int) -> int:
+    """Keep roughly 2^10 distinguished points per expected collision."""
+    return max(0, bits // 2 - 10)
+
+def predicted_work(bits: int) -> float:
+    """Expected evaluations of a random k-bit function until the first repeat."""
+    return math.sqrt(math.pi / 2 * 2.0 ** bits)
+
+# --- Workers -----------------------------------------------------------------------
+def _walk_trails(bits: int, dp_bits: int, trails: int) -> List[Tuple[int, Optional[int], int]]:
+    """Walk `trails` random trails to a distinguished point; returns [(start, point, length)].
+
+    Trails longer than 20 * 2^dp_bits are probably stuck in a cycle and are
+    dropped (point None); their length still counts as work.
+    """
+    sha256 = hashlib.sha256
+    shift = 64 - bits
+    mask = (1 << dp_bits) - 1
+    limit = 20 << dp_bits
+    walked = []
+    for _ in range(trails):
+        start = x = int.from_bytes(os.urandom(8), "big") >> shift
+        for length in range(1, limit + 1):
+            x = int.from_bytes(sha256(x.to_bytes(8, "big")).digest()[:8], "big") >> shift
+            if not x & mask:
+                break
+        walked.append((start, x if not x & mask else None, length))
+    return walked
+
+def locate_collision(a: Tuple[int, int], b: Tuple[int, int], f: Callable[[int], int]) -> Tuple[Optional[Tuple[int, int]], int]:
+    """Re-walk two trails (start, length) that end in the same point.
+
+    Returns ((x, y), evaluations) with x != y and f(x) == f(y), or (None, evaluations)
+    when one start lies on the other trail (the trails never actually merge).
+    """
+    (x, a_len), (y, b_len) = sorted((a, b), key=lambda t: -t[1])
+    work = 0
+    for _ in range(a_len - b_len):
+        x = f(x)
+        work += 1
+    if x == y:
+        return None, work
+    while True:
+        fx, fy = f(x), f(y)
+        work += 2
+        if fx == fy:
+            return (x, y), work
+        x, y = fx, fy
+
+# --- Search --------------------------------------------------------------------------
+def find_collision(bits: int, workers: int, dp_bits: int = None, trails_per_task: int = None) -> dict:
+    if not 1 <= bits <= MAX_BITS:
+        raise ValueError(f"bits must be in 1..{MAX_BITS}")
+    if dp_bits is None:
+        dp_bits = default_dp_bits(bits)
+    if trails_per_task is None:
+        # a small slice of the expected work, capped at ~2^14 evaluations per task
+        per_task = min(1 << 14, predicted_work(bits) / (8 * workers))
+        trails_per_task = max(1, int(per_task) >> dp_bits)
+    f = lambda x: truncated_sha256(x, bits)
+    points = {}
+    work = 0
+    collision = None
+    start = time.perf_counter()
+    jobs = itertools.repeat((None, (bits, dp_bits, trails_per_task)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = hd.bounded_map(pool, _walk_trails, jobs, 2 * workers)
+        for _, trails in results:
+            for trail_start, point, length in trails:
+                work += length
+                if point is None:
+                    continue
+                other = points.get(point)
+                if other is None or other[0] == trail_start:
+                    points[point] = (trail_start, length)
+                    continue
+                pair, extra = locate_collision(other, (trail_start, length), f)
+                work += extra
+                if pair is not None:
+                    collision = pair
+                    break
+            if collision is not None:
+                break
+        results.close()  # cancels the walks still queued
+    elapsed = time.perf_counter() - start
+
+    x, y = collision
+    full_x = hashlib.sha256(x.to_bytes(8, "big")).hexdigest()
+    full_y = hashlib.sha256(y.to_bytes(8, "big")).hexdigest()
+    predicted = predicted_work(bits)
+    return {
+        "bits": bits,
+        "dp_bits": dp_bits,
+        "workers": workers,
+        "inputs": [x.to_bytes(8, "big").hex(), y.to_bytes(8, "big").hex()],
+        "sha256": [full_x, full_y],
+        "truncated": f"{f(x):0{(bits + 3) // 4}x}",
+        "verified": f(x) == f(y) and x != y,
+        "work": work,
+        "predicted_work": predicted,
+        "work_ratio": work / predicted,
+        "stored_points": len(points),
+        "seconds": elapsed,
+        "hashes_per_second": work / elapsed if elapsed > 0 else None
+    }
+
+# --- CLI -------------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Find collisions in SHA-256 truncated to k bits.")
+    parser.add_argument("--bits", default="16,20,24,28,32",
+                        help="Truncation sizes k, e.g. 40 or 16-32 or 16,24,32 (max 64; default: 16,20,24,28,32).")
+    parser.add_argument("--trials", type=int, default=1,
+                        help="Collisions to find per k; the mean work is reported (default: 1).")
+    parser.add_argument("--dp-bits", type=int, default=None,
+                        help="Distinguished-point bits d (default: k/2 - 10, at least 0).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count).")
+    parser.add_argument("--json", default=None,
+                        help="Also write every run as JSON to this file ('-' for stdout).")
+    args = parser.parse_args()
+
+    try:
+        sizes = hd.parse_index_spec(args.bits)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if not sizes or any(not 1 <= k <= MAX_BITS for k in sizes):
+        parser.error(f"--bits must be in 1..{MAX_BITS}")
+    workers = args.workers or os.cpu_count() or 1
+
+    runs = []
+    print(f"{'k':>3} {'work':>14} {'sqrt(pi/2*2^k)':>15} {'ratio':>6} {'seconds':>9} {'hashes/s':>11}  collision",
+          file=sys.stderr)
+    for bits in sizes:
+        results = [find_collision(bits, workers, args.dp_bits) for _ in range(max(1, args.trials))]
+        runs.extend(results)
+        mean_work = sum(r["work"] for r in results) / len(results)
+        seconds = sum(r["seconds"] for r in results)
+        last = results[-1]
+        ok = "✅" if all(r["verified"] for r in results) else "❌"
+        print(f"{bits:3d} {mean_work:14,.0f} {last['predicted_work']:15,.0f} {mean_work / last['predicted_work']:6.2f} "
+              f"{seconds:9.2f} {sum(r['work'] for r in results) / seconds:11,.0f}  "
+              f"{ok} {last['inputs'][0]} / {last['inputs'][1]} -> {last['truncated']}", file=sys.stderr, flush=True)
+
+    if args.json:
+        text = json.dumps(runs, indent=1)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w", encoding="utf-8") as fh:
+                fh.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
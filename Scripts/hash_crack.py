@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dictionary audit of unsalted SHA-256 password digests: [digest] = SHA256(?)
+- Target digests are loaded once into a set (one per line: "digest" or "user:digest").
+- The wordlist is split into newline-aligned byte ranges; every worker reads its own
+  ranges from disk, so wordlists larger than RAM stream through with constant memory.
+- Each word is expanded with mangling rules (a small hashcat/John-style subset) and
+  hashed with hashlib.sha256; hits and hashes/s are reported as they come in.
+Only run this against digests you are authorized to audit.
+"""
+
+import argparse
+import hashlib
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import hash_demo as hd
+
+DEFAULT_RULES = [":", "c", "u", "r", "d", "$1", "$!", "c$1", "$1$2$3", "sa@", "so0", "se3", "c$2$0$2$4"]
+
+# --- Mangling rules ---------------------------------------------------------------
+# Supported operations (applied left to right):
+#   :  word unchanged      l  lowercase     u  uppercase      c  capitalize
+#   r  reverse             d  duplicate     $X append X       ^X prepend X
+#   sXY replace every X with Y
+def compile_rule(rule: str) -> Callable[[bytes], bytes]:
+    ops = []
+    i = 0
+    while i < len(rule):
+        op = rule[i]
+        if op == ":":
+            pass
+        elif op == "l":
+            ops.append(bytes.lower)
+        elif op == "u":
+            ops.append(bytes.upper)
+        elif op == "c":
+            ops.append(bytes.capitalize)
+        elif op == "r":
+            ops.append(lambda w: w[::-1])
+        elif op == "d":
+            ops.append(lambda w: w + w)
+        elif op in "$^" and i + 1 < len(rule):
+            ch = rule[i + 1].encode("utf-8")
+            ops.append((lambda w, ch=ch: w + ch) if op == "$" else (lambda w, ch=ch: ch + w))
+            i += 1
+        elif op == "s" and i + 2 < len(rule):
+            old, new = rule[i + 1].encode("utf-8"), rule[i + 2].encode("utf-8")
+            ops.append(lambda w, old=old, new=new: w.replace(old, new))
+            i += 2
+        else:
+            raise ValueError(f"bad rule {rule!r} at position {i}")
+        i += 1
+
+    def apply(word: bytes) -> bytes:
+        for fn in ops:
+            word = fn(word)
+        return word
+    return apply
+
+def load_rules(spec: str, path: str = None) -> List[str]:
+    rules = DEFAULT_RULES if spec == "default" else [r for r in spec.split(",") if r]
+    if path:
+        with open(path, "r", encoding="utf-8") as fh:
+            rules = [line.rstrip("\n") for line in fh if line.strip() and not line.startswith("#")]
+    for rule in rules:
+        compile_rule(rule)  # fail before starting workers
+    return rules
+
+# --- Targets / wordlist ---------------------------------------------------------------
+def load_targets(path: str) -> Dict[bytes, List[str]]:
+    """{digest: [labels]} from lines of "digest" or "label:digest" (also "label,digest")."""
+    targets = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        for n, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            label, sep, digest = line.replace(",", ":").rpartition(":")
+            try:
+                raw = bytes.fromhex(digest)
+            except ValueError:
+                raw = b""
+            if len(raw) != 32:
+                raise SystemExit(f"{path}:{n}: not a SHA-256 hex digest: {digest!r}")
+            targets.setdefault(raw, []).append(label if sep else f"line {n}")
+    return targets
+
+def iter_ranges(path: str, chunk_bytes: int) -> Iterator[Tuple[int, int]]:
+    """Newline-aligned (start, end) byte ranges covering path; only boundaries are read."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        start = 0
+        while start < size:
+            fh.seek(min(start + chunk_bytes, size))
+            fh.readline()
+            end = min(fh.tell(), size)
+            yield start, end
+            start = end
+
+# --- Workers ------------------------------------------------------------------------
+_TARGETS = None
+_RULES = None
+
+def _init_worker(targets: frozenset, rules: List[str]):
+    global _TARGETS, _RULES
+    _TARGETS = targets
+    _RULES = [(rule, compile_rule(rule)) for rule in rules]
+
+def _crack_range(path: str, start: int, end: int) -> Tuple[int, List[Tuple[bytes, bytes, str]], int]:
+    """Hash every mangled word in [start, end); returns (end - start, hits, candidates)."""
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        words = fh.read(end - start).splitlines()
+    targets = _TARGETS
+    sha256 = hashlib.sha256
+    hits = []
+    tried = 0
+    for rule, mangle in _RULES:
+        candidates = words if rule == ":" else [mangle(w) for w in words]
+        # hits are rare, so rehashing them beats keeping every digest around
+        hits.extend((sha256(w).digest(), w, rule) for w in candidates if sha256(w).digest() in targets)
+        tried += len(candidates)
+    return end - start, hits, tried
+
+# --- CLI -------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Audit unsalted SHA-256 password digests with a wordlist.")
+    parser.add_argument("targets", help="File of target digests: 'digest' or 'user:digest' per line.")
+    parser.add_argument("wordlist", help="Wordlist, one candidate per line (may be larger than RAM).")
+    parser.add_argument("--rules", default="default",
+                        help="Comma-separated mangling rules, e.g. ':,c,$1,sa@' (default: built-in set).")
+    parser.add_argument("--rules-file", default=None,
+                        help="Read rules from a file, one per line (overrides --rules).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count).")
+    parser.add_argument("--chunk-mb", type=float, default=1.0,
+                        help="Wordlist bytes per task in MB (default: 1).")
+    parser.add_argument("--potfile", default=None,
+                        help="Also append 'digest:password' for every hit to this file.")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="Keep searching after every target has been found.")
+    parser.add_argument("--progress", type=float, default=5.0, metavar="SECONDS",
+                        help="Print progress to stderr every SECONDS (0 disables; default: 5).")
+    args = parser.parse_args()
+
+    try:
+        rules = load_rules(args.rules, args.rules_file)
+    except ValueError as exc:
+        parser.error(str(exc))
+    targets = load_targets(args.targets)
+    if not targets:
+        parser.error(f"{args.targets}: no target digests")
+    workers = args.workers or os.cpu_count() or 1
+    size = os.path.getsize(args.wordlist)
+    ranges = iter_ranges(args.wordlist, max(1, int(args.chunk_mb * (1 << 20))))
+
+    found = {}
+    # ranges are read lazily, as each is submitted: stop once every target is found
+    ranges = itertools.takewhile(lambda _: args.keep_going or len(found) < len(targets), ranges)
+    jobs = ((None, (args.wordlist, *r)) for r in ranges)
+    done_bytes = 0
+    tried = 0
+    start = last_report = time.perf_counter()
+    pot = open(args.potfile, "a", encoding="utf-8") if args.potfile else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(frozenset(targets), rules)) as pool:
+            for _, (nbytes, hits, n) in hd.bounded_map(pool, _crack_range, jobs, 2 * workers):
+                done_bytes += nbytes
+                tried += n
+                for digest, password, rule in hits:
+                    if digest in found:
+                        continue
+                    found[digest] = password
+                    text = password.decode("utf-8", errors="backslashreplace")
+                    for label in targets[digest]:
+                        print(f"{label}:{text}  (rule {rule})", flush=True)
+                    if pot is not None:
+                        pot.write(f"{digest.hex()}:{text}\n")
+                        pot.flush()
+                now = time.perf_counter()
+                if args.progress > 0 and now - last_report >= args.progress:
+                    last_report = now
+                    print(f"{done_bytes / max(1, size):6.1%}  {tried / (now - start):,.0f} hashes/s  "
+                          f"{len(found)}/{len(targets)} found", file=sys.stderr)
+    finally:
+        if pot is not None:
+            pot.close()
+
+    elapsed = time.perf_counter() - start
+    rate = tried / elapsed if elapsed > 0 else float("inf")
+    print(f"{len(found)}/{len(targets)} digests cracked; {tried:,} candidates ({len(rules)} rules) "
+          f"in {elapsed:.3f} s ({rate:,.0f} hashes/s, {workers} workers)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
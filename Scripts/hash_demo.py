@@ -1,310 +1,3129 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-SHA-256 Step-by-Step CLI Demo (with pacing)
-- Pretty output with 'rich' if installed, otherwise plain text.
-- Adds timed delays and optional step-by-step pauses.
-"""
-
-import argparse
-import hashlib
-import struct
-import time
-from typing import List, Tuple
-
-# --- Optional pretty printing (fallback to plain if Rich not installed) ---
-USE_RICH = True
-try:
-    from rich.console import Console
-    from rich.table import Table
-    from rich.panel import Panel
-    from rich.rule import Rule
-    from rich.box import SIMPLE
-    console = Console()
-except Exception:
-    USE_RICH = False
-    console = None
-
-def rotr(x, n): return ((x >> n) | (x << (32 - n))) & 0xFFFFFFFF
-def shr(x, n):  return (x >> n) & 0xFFFFFFFF
-
-def Ch(x, y, z):   return (x & y) ^ (~x & z)
-def Maj(x, y, z):  return (x & y) ^ (x & z) ^ (y & z)
-
-def Sigma0(x): return rotr(x, 2) ^ rotr(x, 13) ^ rotr(x, 22)
-def Sigma1(x): return rotr(x, 6) ^ rotr(x, 11) ^ rotr(x, 25)
-def sigma0(x): return rotr(x, 7) ^ rotr(x, 18) ^ shr(x, 3)
-def sigma1(x): return rotr(x, 17) ^ rotr(x, 19) ^ shr(x, 10)
-
-H_INIT = [
-    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
-    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
-]
-
-K = [
-    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
-    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
-    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
-    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
-    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
-    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
-    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
-    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
-]
-
-# --- Utility pacing helpers ---------------------------------------------------
-def _sleep(delay: float):
-    if delay > 0:
-        time.sleep(delay)
-
-def _pause(step: bool, prompt="Press [Enter] to continue..."):
-    if step:
-        try:
-            input(prompt)
-        except KeyboardInterrupt:
-            pass
-
-# --- Core SHA-256 -------------------------------------------------------------
-def sha256_pad(msg: bytes) -> bytes:
-    bit_len = len(msg) * 8
-    padded = msg + b"\x80"
-    while ((len(padded) * 8) % 512) != 448:
-        padded += b"\x00"
-    padded += struct.pack(">Q", bit_len)
-    return padded
-
-def chunk_blocks(padded: bytes) -> List[bytes]:
-    return [padded[i:i+64] for i in range(0, len(padded), 64)]
-
-def words_from_block(block64: bytes) -> List[int]:
-    return list(struct.unpack(">16I", block64))
-
-def extend_schedule(w: List[int]) -> List[int]:
-    W = w[:] + [0]*48
-    for t in range(16, 64):
-        W[t] = (sigma1(W[t-2]) + W[t-7] + sigma0(W[t-15]) + W[t-16]) & 0xFFFFFFFF
-    return W
-
-def compress_block(H: List[int], W: List[int], rounds_to_log: int) -> Tuple[List[int], List[dict]]:
-    a, b, c, d, e, f, g, h = H
-    round_logs = []
-    for t in range(64):
-        T1 = (h + Sigma1(e) + Ch(e, f, g) + K[t] + W[t]) & 0xFFFFFFFF
-        T2 = (Sigma0(a) + Maj(a, b, c)) & 0xFFFFFFFF
-        new_h = g
-        new_g = f
-        new_f = e
-        new_e = (d + T1) & 0xFFFFFFFF
-        new_d = c
-        new_c = b
-        new_b = a
-        new_a = (T1 + T2) & 0xFFFFFFFF
-        a, b, c, d, e, f, g, h = new_a, new_b, new_c, new_d, new_e, new_f, new_g, new_h
-
-        if t < rounds_to_log:
-            round_logs.append({
-                "t": t,
-                "W[t]": W[t],
-                "K[t]": K[t],
-                "T1": T1,
-                "T2": T2,
-                "a": a, "b": b, "c": c, "d": d, "e": e, "f": f, "g": g, "h": h
-            })
-
-    H_out = [
-        (H[0] + a) & 0xFFFFFFFF, (H[1] + b) & 0xFFFFFFFF,
-        (H[2] + c) & 0xFFFFFFFF, (H[3] + d) & 0xFFFFFFFF,
-        (H[4] + e) & 0xFFFFFFFF, (H[5] + f) & 0xFFFFFFFF,
-        (H[6] + g) & 0xFFFFFFFF, (H[7] + h) & 0xFFFFFFFF
-    ]
-    return H_out, round_logs
-
-def digest_sha256_with_logs(msg: bytes, rounds_to_log: int = 8):
-    padded = sha256_pad(msg)
-    blocks = chunk_blocks(padded)
-
-    H = H_INIT[:]
-    all_block_logs = []
-    for i, block in enumerate(blocks):
-        W0_15 = words_from_block(block)
-        W = extend_schedule(W0_15)
-        H, round_logs = compress_block(H, W, rounds_to_log if i == 0 else 0)
-        all_block_logs.append({
-            "block_index": i,
-            "block_hex": block.hex(),
-            "W": W,
-            "round_logs": round_logs
-        })
-
-    out = b"".join(struct.pack(">I", h) for h in H).hex()
-    return {
-        "input": msg,
-        "padded_hex": padded.hex(),
-        "blocks": all_block_logs,
-        "digest": out
-    }
-
-# --- Output helpers with pacing ----------------------------------------------
-def print_header(title: str, delay: float):
-    if USE_RICH:
-        console.rule(f"[bold]{title}[/bold]")
-    else:
-        print("\n" + "="*len(title))
-        print(title)
-        print("="*len(title))
-    _sleep(delay)
-
-def print_kv(title: str, kv: List[Tuple[str, str]], delay: float, step: bool):
-    if USE_RICH:
-        if title:
-            console.print(Panel.fit(title, style="bold"))
-        for k, v in kv:
-            console.print(f"[bold]{k}[/bold]: {v}")
-            _sleep(delay)
-    else:
-        if title: print(f"\n{title}:")
-        for k, v in kv:
-            print(f"  - {k}: {v}")
-            _sleep(delay)
-    _pause(step)
-
-def print_schedule(W: List[int], limit: int, each_delay: float, step: bool):
-    limit = max(0, min(64, limit))
-    if USE_RICH:
-        console.print(Panel.fit(f"Message Schedule W[0..{limit-1}]", style="bold"))
-        for i in range(limit):
-            console.print(f"[dim]W[{i:2d}][/dim] = 0x{W[i]:08x}")
-            _sleep(each_delay)
-    else:
-        print(f"\nMessage Schedule W[0..{limit-1}]:")
-        for i in range(limit):
-            print(f"  W[{i:2d}] = 0x{W[i]:08x}")
-            _sleep(each_delay)
-    _pause(step)
-
-def print_rounds(round_logs: List[dict], each_delay: float, step: bool):
-    if not round_logs:
-        return
-    if USE_RICH:
-        console.print(Panel.fit(f"First {len(round_logs)} Rounds", style="bold"))
-    else:
-        print(f"\nFirst {len(round_logs)} Rounds:")
-    for r in round_logs:
-        line = (
-            f"t={r['t']:02d}  "
-            f"W=0x{r['W[t]']:08x}  K=0x{r['K[t]']:08x}  "
-            f"T1=0x{r['T1']:08x}  T2=0x{r['T2']:08x}  "
-            f"a..h=0x{r['a']:08x},0x{r['b']:08x},0x{r['c']:08x},0x{r['d']:08x},"
-            f"0x{r['e']:08x},0x{r['f']:08x},0x{r['g']:08x},0x{r['h']:08x}"
-        )
-        if USE_RICH:
-            console.print(line)
-        else:
-            print(line)
-        _sleep(each_delay)
-    _pause(step)
-
-# --- CLI ---------------------------------------------------------------------
-def main():
-    parser = argparse.ArgumentParser(
-        description="Pretty SHA-256 step-by-step demo with pacing."
-    )
-    parser.add_argument("message", nargs="?", default=None,
-                        help="Message to hash. If omitted, you'll be prompted.")
-    parser.add_argument("--rounds", type=int, default=8,
-                        help="How many rounds of the first block to display (default: 8).")
-    parser.add_argument("--no-schedule", action="store_true",
-                        help="Do not print the message schedule table.")
-    parser.add_argument("--schedule-limit", type=int, default=16,
-                        help="How many W[t] entries to show (default: 16; max 64).")
-    parser.add_argument("--plain", action="store_true",
-                        help="Force plain text (ignore Rich if installed).")
-
-    # pacing options
-    parser.add_argument("--delay", type=float, default=1,
-                        help="Base delay (seconds) between printed items (default: 0.35).")
-    parser.add_argument("--schedule-delay", type=float, default=None,
-                        help="Delay per W[t] line (overrides --delay).")
-    parser.add_argument("--round-delay", type=float, default=None,
-                        help="Delay per round printed (overrides --delay).")
-    parser.add_argument("--step", action="store_true",
-                        help="Pause for Enter between major sections.")
-
-    args = parser.parse_args()
-
-    global USE_RICH
-    if args.plain:
-        USE_RICH = False
-
-    msg = args.message
-    if msg is None:
-        try:
-            if USE_RICH:
-                console.print(Panel.fit("Enter the message to hash:", title="Input"))
-                msg = input("> ")
-            else:
-                msg = input("Enter the message to hash: ")
-        except KeyboardInterrupt:
-            return
-
-    # Effective per-line delays
-    schedule_delay = args.schedule_delay if args.schedule_delay is not None else args.delay
-    round_delay = args.round_delay if args.round_delay is not None else args.delay
-
-    data = msg.encode("utf-8")
-    result = digest_sha256_with_logs(data, rounds_to_log=max(0, args.rounds))
-
-    # Header
-    print_header("SHA-256 Step-by-Step", args.delay)
-    print_kv("Input", [
-        ("Text", repr(msg)),
-        ("Bytes (hex)", data.hex()),
-        ("Bit length", f"{len(data)*8} bits"),
-    ], delay=args.delay, step=args.step)
-
-    # Preprocessing
-    print_header("Preprocessing", args.delay)
-    padded_bits_len = len(bytes.fromhex(result["padded_hex"])) * 8
-    print_kv("Padding", [
-        ("Padded length (bits)", str(padded_bits_len)),
-        ("Padded (hex)", result["padded_hex"]),
-    ], delay=args.delay, step=args.step)
-    print_kv("Blocks", [
-        ("Count", str(len(result["blocks"]))),
-        ("Block size", "512 bits (64 bytes)"),
-    ], delay=args.delay, step=args.step)
-
-    # First block deep-dive
-    if result["blocks"]:
-        b0 = result["blocks"][0]
-        print_header("Block 0", args.delay)
-        print_kv("Block 0", [("Bytes (hex)", b0["block_hex"])], delay=args.delay, step=args.step)
-
-        if not args.no_schedule:
-            print_schedule(b0["W"], limit=args.schedule_limit,
-                           each_delay=schedule_delay, step=args.step)
-
-        print_rounds(b0["round_logs"], each_delay=round_delay, step=args.step)
-
-    # Final digest + verification
-    print_header("Result", args.delay)
-    ours = result["digest"]
-    theirs = hashlib.sha256(data).hexdigest()
-    ok = "✅ MATCH" if ours == theirs else "❌ MISMATCH"
-    print_kv("Digest", [
-        ("Computed (this script)", ours),
-        ("hashlib.sha256", theirs),
-        ("Verification", ok),
-    ], delay=args.delay, step=False)
-
-    if USE_RICH:
-        console.print(Rule())
-        console.print(
-            "[dim]Tips:[/dim] "
-            "[bold]--delay 0.1[/bold] faster • "
-            "[bold]--step[/bold] for manual pauses • "
-            "[bold]--schedule-limit 64[/bold] to show full W"
-        )
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SHA-256 Step-by-Step CLI Demo (with pacing)
+- Pretty output with 'rich' if installed, otherwise plain text.
+- Adds timed delays and optional step-by-step pauses.
+- Start it as `python -m hash_demo ...` for the quickest startup: the module's
+  bytecode then comes from __pycache__, while a script path is recompiled on
+  every run (~40 ms for this file).
+"""
+
+import argparse
+import functools
+import hashlib
+import hmac as hmac_module
+import io
+import json
+import marshal
+import mmap
+import os
+import queue
+import re
+import stat
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from typing import Iterator, List, NamedTuple, Tuple
+
+# --- Optional pretty printing (fallback to plain if Rich not installed) ---
+# Rich (~30 ms) and NumPy (~70 ms) are imported on first use rather than at
+# import time, so --plain runs and the tools that import this module as a
+# library never pay for them.
+USE_RICH = True  # cleared by --plain, or by _use_rich() when Rich is missing
+console = None
+
+def _use_rich() -> bool:
+    """True if output goes through Rich; imports it and builds the Console once."""
+    global USE_RICH, console, Console, Panel, Rule, Text
+    if USE_RICH and console is None:
+        try:
+            from rich.console import Console
+            from rich.panel import Panel
+            from rich.rule import Rule
+            from rich.text import Text
+            console = Console()
+        except Exception:
+            USE_RICH = False
+    return USE_RICH
+
+# --- Optional vectorized engine (NumPy) ---
+np = None
+_NUMPY_TRIED = False
+
+def load_numpy():
+    """The numpy module (imported on first call), or None if it is not installed."""
+    global np, _NUMPY_TRIED, _K_NP, _H_INIT_NP
+    if not _NUMPY_TRIED:
+        _NUMPY_TRIED = True
+        try:
+            import numpy
+        except Exception:
+            return None
+        np = numpy
+        _K_NP = np.array(K, dtype=np.uint32)
+        _H_INIT_NP = np.array(H_INIT, dtype=np.uint32)
+    return np
+
+def rotr(x, n): return ((x >> n) | (x << (32 - n))) & 0xFFFFFFFF
+def shr(x, n):  return (x >> n) & 0xFFFFFFFF
+
+def Ch(x, y, z):   return (x & y) ^ (~x & z)
+def Maj(x, y, z):  return (x & y) ^ (x & z) ^ (y & z)
+
+def Sigma0(x): return rotr(x, 2) ^ rotr(x, 13) ^ rotr(x, 22)
+def Sigma1(x): return rotr(x, 6) ^ rotr(x, 11) ^ rotr(x, 25)
+def sigma0(x): return rotr(x, 7) ^ rotr(x, 18) ^ shr(x, 3)
+def sigma1(x): return rotr(x, 17) ^ rotr(x, 19) ^ shr(x, 10)
+
+H_INIT = [
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+]
+
+K = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]
+
+# --- SHA-2 family constants -----------------------------------------------------
+# SHA-224 shares SHA-256's K and round function; SHA-384 and SHA-512/256 share
+# SHA-512's. Only the initial values and the digest truncation differ.
+K_512 = [
+    0x428a2f98d728ae22, 0x7137449123ef65cd, 0xb5c0fbcfec4d3b2f, 0xe9b5dba58189dbbc,
+    0x3956c25bf348b538, 0x59f111f1b605d019, 0x923f82a4af194f9b, 0xab1c5ed5da6d8118,
+    0xd807aa98a3030242, 0x12835b0145706fbe, 0x243185be4ee4b28c, 0x550c7dc3d5ffb4e2,
+    0x72be5d74f27b896f, 0x80deb1fe3b1696b1, 0x9bdc06a725c71235, 0xc19bf174cf692694,
+    0xe49b69c19ef14ad2, 0xefbe4786384f25e3, 0x0fc19dc68b8cd5b5, 0x240ca1cc77ac9c65,
+    0x2de92c6f592b0275, 0x4a7484aa6ea6e483, 0x5cb0a9dcbd41fbd4, 0x76f988da831153b5,
+    0x983e5152ee66dfab, 0xa831c66d2db43210, 0xb00327c898fb213f, 0xbf597fc7beef0ee4,
+    0xc6e00bf33da88fc2, 0xd5a79147930aa725, 0x06ca6351e003826f, 0x142929670a0e6e70,
+    0x27b70a8546d22ffc, 0x2e1b21385c26c926, 0x4d2c6dfc5ac42aed, 0x53380d139d95b3df,
+    0x650a73548baf63de, 0x766a0abb3c77b2a8, 0x81c2c92e47edaee6, 0x92722c851482353b,
+    0xa2bfe8a14cf10364, 0xa81a664bbc423001, 0xc24b8b70d0f89791, 0xc76c51a30654be30,
+    0xd192e819d6ef5218, 0xd69906245565a910, 0xf40e35855771202a, 0x106aa07032bbd1b8,
+    0x19a4c116b8d2d0c8, 0x1e376c085141ab53, 0x2748774cdf8eeb99, 0x34b0bcb5e19b48a8,
+    0x391c0cb3c5c95a63, 0x4ed8aa4ae3418acb, 0x5b9cca4f7763e373, 0x682e6ff3d6b2b8a3,
+    0x748f82ee5defb2fc, 0x78a5636f43172f60, 0x84c87814a1f0ab72, 0x8cc702081a6439ec,
+    0x90befffa23631e28, 0xa4506cebde82bde9, 0xbef9a3f7b2c67915, 0xc67178f2e372532b,
+    0xca273eceea26619c, 0xd186b8c721c0c207, 0xeada7dd6cde0eb1e, 0xf57d4f7fee6ed178,
+    0x06f067aa72176fba, 0x0a637dc5a2c898a6, 0x113f9804bef90dae, 0x1b710b35131c471b,
+    0x28db77f523047d84, 0x32caab7b40c72493, 0x3c9ebe0a15c9bebc, 0x431d67c49c100d4c,
+    0x4cc5d4becb3e42b6, 0x597f299cfc657e2a, 0x5fcb6fab3ad6faec, 0x6c44198c4a475817
+]
+H_INIT_512 = [
+    0x6a09e667f3bcc908, 0xbb67ae8584caa73b, 0x3c6ef372fe94f82b, 0xa54ff53a5f1d36f1,
+    0x510e527fade682d1, 0x9b05688c2b3e6c1f, 0x1f83d9abfb41bd6b, 0x5be0cd19137e2179
+]
+H_INIT_384 = [
+    0xcbbb9d5dc1059ed8, 0x629a292a367cd507, 0x9159015a3070dd17, 0x152fecd8f70e5939,
+    0x67332667ffc00b31, 0x8eb44a8768581511, 0xdb0c2e0d64f98fa7, 0x47b5481dbefa4fa4
+]
+H_INIT_224 = [
+    0xc1059ed8, 0x367cd507, 0x3070dd17, 0xf70e5939,
+    0xffc00b31, 0x68581511, 0x64f98fa7, 0xbefa4fa4
+]
+H_INIT_512_256 = [
+    0x22312194fc2bf72c, 0x9f555fa3c84c64c2, 0x2393b86b6f53b151, 0x963877195940eabd,
+    0x96283ee2a88effe3, 0xbe5e1e2553863992, 0x2b0199fc2c85b8aa, 0x0eb72ddc81c52ca2
+]
+
+class SHA2Variant(NamedTuple):
+    name: str                # display name, e.g. "SHA-512/256"
+    hashlib_name: str
+    word_bits: int           # 32 or 64
+    rounds: int              # 64 or 80
+    H_init: Tuple[int, ...]
+    K: Tuple[int, ...]
+    Sigma0: Tuple[int, int, int]   # rotations
+    Sigma1: Tuple[int, int, int]   # rotations
+    sigma0: Tuple[int, int, int]   # two rotations, then a shift
+    sigma1: Tuple[int, int, int]   # two rotations, then a shift
+    digest_size: int         # bytes kept from the final chaining value
+
+    @property
+    def word_bytes(self) -> int:
+        return self.word_bits // 8
+
+    @property
+    def block_size(self) -> int:
+        return 16 * self.word_bytes
+
+    @property
+    def length_bytes(self) -> int:
+        return 2 * self.word_bytes
+
+    @property
+    def mask(self) -> int:
+        return (1 << self.word_bits) - 1
+
+_ROT_256 = dict(Sigma0=(2, 13, 22), Sigma1=(6, 11, 25), sigma0=(7, 18, 3), sigma1=(17, 19, 10))
+_ROT_512 = dict(Sigma0=(28, 34, 39), Sigma1=(14, 18, 41), sigma0=(1, 8, 7), sigma1=(19, 61, 6))
+
+SHA224 = SHA2Variant("SHA-224", "sha224", 32, 64, tuple(H_INIT_224), tuple(K), digest_size=28, **_ROT_256)
+SHA256 = SHA2Variant("SHA-256", "sha256", 32, 64, tuple(H_INIT), tuple(K), digest_size=32, **_ROT_256)
+SHA384 = SHA2Variant("SHA-384", "sha384", 64, 80, tuple(H_INIT_384), tuple(K_512), digest_size=48, **_ROT_512)
+SHA512 = SHA2Variant("SHA-512", "sha512", 64, 80, tuple(H_INIT_512), tuple(K_512), digest_size=64, **_ROT_512)
+SHA512_256 = SHA2Variant("SHA-512/256", "sha512_256", 64, 80, tuple(H_INIT_512_256), tuple(K_512),
+                         digest_size=32, **_ROT_512)
+
+SHA2_VARIANTS = {
+    "sha224": SHA224, "sha256": SHA256, "sha384": SHA384,
+    "sha512": SHA512, "sha512_256": SHA512_256
+}
+
+# --- Stage profiler (--profile) ----------------------------------------------
+class StageProfiler:
+    """Wall time and call counts per stage and per block.
+
+    Stages nest; each records only its exclusive time, so "output" does not
+    include the "pacing" sleeps made while printing.
+    """
+    def __init__(self):
+        self.records = {}   # (stage, block) -> [calls, seconds]
+        self._stack = []    # [stage, block, start, child_seconds]
+        self.current_block = None
+        self._started = time.perf_counter()
+
+    def start(self, stage: str, block=None):
+        self._stack.append([stage, block, time.perf_counter(), 0.0])
+
+    def stop(self):
+        stage, block, start, child = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        rec = self.records.setdefault((stage, block), [0, 0.0])
+        rec[0] += 1
+        rec[1] += elapsed - child
+        if self._stack:
+            self._stack[-1][3] += elapsed
+
+    @contextmanager
+    def stage(self, stage: str, block=None):
+        self.start(stage, block)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def to_dict(self) -> dict:
+        stages, blocks = {}, {}
+        for (stage, block), (calls, seconds) in self.records.items():
+            total = stages.setdefault(stage, {"calls": 0, "seconds": 0.0})
+            total["calls"] += calls
+            total["seconds"] += seconds
+            if block is not None:
+                blocks.setdefault(str(block), {})[stage] = {"calls": calls, "seconds": seconds}
+        return {
+            "wall_seconds": time.perf_counter() - self._started,
+            "stages": stages,
+            "blocks": blocks
+        }
+
+_PROFILER = None
+
+def _no_stage(stage: str, block=None):
+    """Stand-in for StageProfiler.stage when nothing is being profiled."""
+    return nullcontext()
+
+# --- Timeline scheduler (drift-free pacing) -------------------------------------
+# Independent time.sleep() calls drift: every line's render time is added on
+# top of its delay. Under a Timeline each pacing point has an absolute deadline
+# on the monotonic clock instead ("this line is due d seconds after the previous
+# one was due"), so render time is taken out of the following sleep. With a plan
+# the delays themselves are replaced: a dry run records the nominal delay of
+# every pacing point per section, and plan_timeline() rescales them to fit
+# --total-duration and --section-budget (the --delay values act as weights).
+# A virtual Timeline (--record) never sleeps: its clock is the deadline itself.
+class Timeline:
+    def __init__(self, plan: List[float] = None, recording: bool = False, virtual: bool = False):
+        self.plan = plan
+        self.recording = recording
+        self.virtual = virtual
+        self.points = []  # recording: (section, nominal delay) per pacing point
+        self.section = ""
+        self.index = 0
+        self.start = None
+        self.deadline = None
+        self.max_late = 0.0
+
+    def begin(self):
+        self.start = self.deadline = 0.0 if self.virtual else time.monotonic()
+
+    def elapsed(self) -> float:
+        return (self.deadline if self.virtual else time.monotonic()) - self.start
+
+    def wait(self, delay: float):
+        if self.recording:
+            self.points.append((self.section, max(0.0, delay)))
+            return
+        if self.plan is not None:
+            delay = self.plan[self.index] if self.index < len(self.plan) else 0.0
+            self.index += 1
+        self.deadline += max(0.0, delay)
+        if self.virtual:
+            return
+        remaining = self.deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        else:
+            self.max_late = max(self.max_late, -remaining)
+
+    def rebase(self):
+        """Restart the deadlines from now (after waiting for the user)."""
+        if not self.recording and not self.virtual:
+            self.deadline = time.monotonic()
+
+    def finish(self, total: float = None) -> float:
+        """Wait out the rest of total (if given); returns the elapsed seconds."""
+        if self.recording:
+            return 0.0
+        if self.virtual:
+            if total is not None:
+                self.deadline = max(self.deadline, self.start + total)
+            return self.elapsed()
+        if total is not None:
+            remaining = self.start + total - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        return time.monotonic() - self.start
+
+def plan_timeline(points: List[Tuple[str, float]], total: float = None, budgets: dict = None) -> List[float]:
+    """Per-point delays: each budgeted section is scaled to its budget, the rest to
+    whatever remains of total (or left nominal without one). A group whose
+    nominal delays are all zero gets its time split evenly."""
+    budgets = {name.lower(): seconds for name, seconds in (budgets or {}).items()}
+    sections = {section.lower() for section, _ in points}
+    missing = sorted(set(budgets) - sections)
+    if missing:
+        names = ", ".join(repr(s) for s in dict.fromkeys(section for section, _ in points) if s)
+        raise ValueError(f"no section named {missing[0]!r} (sections: {names})")
+    if total is not None and sum(budgets.values()) > total:
+        raise ValueError("the section budgets add up to more than --total-duration")
+    groups = {}
+    for i, (section, _) in enumerate(points):
+        key = section.lower()
+        groups.setdefault(key if key in budgets else None, []).append(i)
+
+    out = [delay for _, delay in points]
+    for key, idxs in groups.items():
+        if key is not None:
+            target = budgets[key]
+        elif total is not None:
+            target = total - sum(budgets.values())
+        else:
+            continue
+        nominal = sum(points[i][1] for i in idxs)
+        for i in idxs:
+            out[i] = points[i][1] * target / nominal if nominal > 0 else target / len(idxs)
+    return out
+
+class _DryRunOutput(io.TextIOBase):
+    """Swallows output during the planning run but answers isatty() like the real stdout."""
+    def __init__(self, tty: bool):
+        self._tty = tty
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def isatty(self) -> bool:
+        return self._tty
+
+_TIMELINE = None
+_REPLAY = None  # event streams of the planning run, keyed by name (see timeline_events)
+
+class ReplayableEvents:
+    """An event stream that can be iterated more than once.
+
+    The first pass pulls events from make() and keeps them; a later pass
+    replays the kept events, then carries on from make() where the first
+    pass stopped (the renderers break out at the digest event).
+    """
+
+    def __init__(self, make):
+        self._make = make
+        self._source = None
+        self._seen = []
+
+    def __iter__(self):
+        if self._source is None:
+            self._source = iter(self._make())
+        i = 0
+        while True:
+            if i == len(self._seen):
+                event = next(self._source, None)  # events are dicts, never None
+                if event is None:
+                    return
+                self._seen.append(event)
+            yield self._seen[i]
+            i += 1
+
+def timeline_events(key: str, make):
+    """make(), except on a planned run, where both passes share one computed stream."""
+    if _REPLAY is None:
+        return make()
+    if key not in _REPLAY:
+        _REPLAY[key] = ReplayableEvents(make)
+    return _REPLAY[key]
+
+def run_on_timeline(render, total: float = None, budgets: dict = None, virtual: bool = False) -> Timeline:
+    """Call render() with drift-free pacing, fitted to total/budgets if given.
+
+    With a total or budgets, render() first runs once with output discarded
+    to record its pacing points, so it must not consume input; event streams
+    it takes through timeline_events() are computed once and replayed on the
+    paced run. virtual=True runs on a virtual clock (see record_asciicast).
+    """
+    global _TIMELINE, _PROFILER, _REPLAY
+    plan = None
+    if total is not None or budgets:
+        _REPLAY = {}
+        recorder = Timeline(recording=True)
+        profiler, _PROFILER = _PROFILER, None
+        _TIMELINE = recorder
+        try:
+            with redirect_stdout(_DryRunOutput(sys.stdout.isatty())):
+                render()
+        finally:
+            _TIMELINE, _PROFILER = None, profiler
+        try:
+            plan = plan_timeline(recorder.points, total, budgets)
+        except ValueError as exc:
+            _REPLAY = None
+            raise SystemExit(f"timeline: {exc}")
+        if total is None:
+            total = sum(plan)
+    timeline = Timeline(plan, virtual=virtual)
+    _TIMELINE = timeline
+    timeline.begin()
+    try:
+        render()
+        elapsed = timeline.finish(total)
+    finally:
+        _TIMELINE, _REPLAY = None, None
+    if plan is not None and not virtual:
+        print(f"timeline: {total:.3f} s planned, {elapsed:.3f} s elapsed "
+              f"({len(plan)} pacing points, worst lateness {timeline.max_late * 1000:.1f} ms)",
+              file=sys.stderr)
+    return timeline
+
+# --- Asciicast recording (--record) ------------------------------------------------
+# The walkthrough runs on a virtual Timeline with stdout replaced by a writer
+# that stamps every write with the virtual clock, so a paced run of any length
+# is written at render speed. Output is asciinema v2: a JSON header line, then
+# one [seconds, "o", text] event per line of the file.
+class AsciicastWriter(io.TextIOBase):
+    """Terminal stand-in for stdout that appends asciicast v2 output events.
+
+    Writes made at the same virtual time are merged into one event. Newlines
+    become CRLF, as a terminal's line discipline would emit them.
+    """
+
+    def __init__(self, fh, width: int, height: int, command: str = None):
+        self._fh = fh
+        self._timeline = None
+        self._pending = []
+        self._stamp = 0.0
+        self._last = 0.0
+        header = {"version": 2, "width": width, "height": height, "timestamp": int(time.time()),
+                  "env": {"TERM": "xterm-256color"}}
+        if command:
+            header["command"] = command
+        fh.write(json.dumps(header) + "\n")
+
+    def _now(self) -> float:
+        if _TIMELINE is not None:
+            self._timeline = _TIMELINE
+        return self._timeline.elapsed() if self._timeline is not None else 0.0
+
+    def _emit(self):
+        if self._pending:
+            text = "".join(self._pending).replace("\r\n", "\n").replace("\n", "\r\n")
+            self._fh.write(json.dumps([round(self._stamp, 6), "o", text], ensure_ascii=False) + "\n")
+            self._last = self._stamp
+            self._pending = []
+
+    def writable(self) -> bool:
+        return True
+
+    def isatty(self) -> bool:
+        return True  # record the paced, per-line rendering
+
+    def write(self, text: str) -> int:
+        now = self._now()
+        if now != self._stamp:
+            self._emit()
+            self._stamp = now
+        if text:
+            self._pending.append(text)
+        return len(text)
+
+    def close(self):
+        """Write what is left; a trailing empty event keeps the full duration."""
+        if not self.closed:
+            now = self._now()
+            self._emit()
+            if now > self._last:
+                self._fh.write(json.dumps([round(now, 6), "o", ""]) + "\n")
+        super().close()
+
+def record_asciicast(path: str, render, total: float = None, budgets: dict = None,
+                     width: int = 120, height: int = 36, command: str = None) -> float:
+    """Run render() on a virtual clock into an asciicast v2 file; returns its duration."""
+    global console
+    tmp = path + ".tmp"
+    saved = console
+    if _use_rich():
+        # color and a fixed width regardless of where the real stdout goes
+        console = Console(force_terminal=True, color_system="truecolor", width=width, height=height)
+    try:
+        with open(tmp, "w", encoding="utf-8") as fh:
+            writer = AsciicastWriter(fh, width, height, command)
+            with redirect_stdout(writer):
+                timeline = run_on_timeline(render, total, budgets, virtual=True)
+            writer.close()
+    finally:
+        console = saved
+    os.replace(tmp, path)
+    return timeline.elapsed()
+
+# --- Utility pacing helpers ---------------------------------------------------
+def _sleep(delay: float):
+    if _TIMELINE is not None:
+        if _PROFILER is not None:
+            with _PROFILER.stage("pacing", _PROFILER.current_block):
+                _TIMELINE.wait(delay)
+        else:
+            _TIMELINE.wait(delay)
+    elif delay > 0:
+        if _PROFILER is not None:
+            with _PROFILER.stage("pacing", _PROFILER.current_block):
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+
+def _pause(step: bool, prompt="Press [Enter] to continue..."):
+    if step:
+        if _PROFILER is not None:
+            _PROFILER.start("pacing", _PROFILER.current_block)
+        try:
+            input(prompt)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if _PROFILER is not None:
+                _PROFILER.stop()
+            if _TIMELINE is not None:
+                _TIMELINE.rebase()
+
+def _profiled_output(fn):
+    """Attribute a print helper's time to the "output" stage while profiling."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _PROFILER is None:
+            return fn(*args, **kwargs)
+        with _PROFILER.stage("output", _PROFILER.current_block):
+            return fn(*args, **kwargs)
+    return wrapper
+
+# --- Core SHA-256 -------------------------------------------------------------
+_BLOCK_WORDS = struct.Struct(">16I")
+
+def sha256_padding(msg_len: int) -> bytes:
+    """0x80, zero fill and the 64-bit bit length, computed in closed form."""
+    zeros = (55 - msg_len) % 64
+    return b"\x80" + b"\x00" * zeros + struct.pack(">Q", (msg_len * 8) & 0xFFFFFFFFFFFFFFFF)
+
+def sha256_pad(msg: bytes) -> bytes:
+    return bytes(msg) + sha256_padding(len(msg))
+
+_BLOCK_STRUCTS = {32: _BLOCK_WORDS, 64: struct.Struct(">16Q")}
+
+def sha2_padding(msg_len: int, variant: SHA2Variant = SHA256) -> bytes:
+    """Padding for any SHA-2 variant: 0x80, zeros, then a 64- or 128-bit length."""
+    bs, lb = variant.block_size, variant.length_bytes
+    zeros = (bs - 1 - lb - msg_len) % bs
+    return b"\x80" + b"\x00" * zeros + ((msg_len * 8) % (1 << (8 * lb))).to_bytes(lb, "big")
+
+def block_count_for(msg_len: int, variant: SHA2Variant = SHA256) -> int:
+    bs = variant.block_size
+    return (msg_len + 1 + variant.length_bytes + bs - 1) // bs
+
+def digest_bytes(H: List[int], variant: SHA2Variant = SHA256) -> bytes:
+    wb = variant.word_bytes
+    return b"".join(h.to_bytes(wb, "big") for h in H)[:variant.digest_size]
+
+def chunk_blocks(padded: bytes) -> List[memoryview]:
+    view = memoryview(padded).cast("B")
+    return [view[i:i+64] for i in range(0, len(view), 64)]
+
+def padded_tail(msg: bytes, variant: SHA2Variant = SHA256) -> memoryview:
+    """The final one or two blocks of msg: its partial last block plus the padding."""
+    view = memoryview(msg).cast("B")
+    full = len(view) - len(view) % variant.block_size
+    return memoryview(bytes(view[full:]) + sha2_padding(len(view), variant))
+
+def iter_padded_blocks(msg: bytes, start: int = 0, variant: SHA2Variant = SHA256,
+                       tail: memoryview = None) -> Iterator[Tuple[memoryview, Tuple[int, ...]]]:
+    """Yield (block, W[0..15]) for every padded block without copying msg.
+
+    Full blocks are read straight out of msg through a memoryview; only the
+    final one or two blocks (tail + padding) are materialized, unless the
+    caller passes padded_tail(msg, variant) as tail. start skips that many
+    leading full blocks.
+    """
+    bs = variant.block_size
+    words = _BLOCK_STRUCTS[variant.word_bits]
+    view = memoryview(msg).cast("B")
+    full = len(view) - len(view) % bs
+    final = padded_tail(view, variant) if tail is None else tail
+    for part in (view[min(start * bs, full):full], final):
+        for i, w in enumerate(words.iter_unpack(part)):
+            yield part[i*bs:i*bs+bs], w
+
+def words_from_block(block64: bytes) -> List[int]:
+    return list(_BLOCK_WORDS.unpack(block64))
+
+def extend_schedule(w: List[int]) -> List[int]:
+    return _schedule_unrolled(w)
+
+def extend_schedule_loop(w: List[int]) -> List[int]:
+    """Reference schedule loop (calls sigma0/sigma1 for every word)."""
+    W = list(w)
+    for t in range(16, 64):
+        W.append((sigma1(W[t-2]) + W[t-7] + sigma0(W[t-15]) + W[t-16]) & 0xFFFFFFFF)
+    return W
+
+def compress_block_loop(H: List[int], W: List[int], rounds_to_log) -> Tuple[List[int], List[dict]]:
+    """Reference round loop (calls the helper functions each round)."""
+    if isinstance(rounds_to_log, int):
+        rounds_to_log = range(rounds_to_log)
+    log_rounds = frozenset(rounds_to_log)
+    a, b, c, d, e, f, g, h = H
+    round_logs = []
+    for t in range(64):
+        T1 = (h + Sigma1(e) + Ch(e, f, g) + K[t] + W[t]) & 0xFFFFFFFF
+        T2 = (Sigma0(a) + Maj(a, b, c)) & 0xFFFFFFFF
+        new_h = g
+        new_g = f
+        new_f = e
+        new_e = (d + T1) & 0xFFFFFFFF
+        new_d = c
+        new_c = b
+        new_b = a
+        new_a = (T1 + T2) & 0xFFFFFFFF
+        a, b, c, d, e, f, g, h = new_a, new_b, new_c, new_d, new_e, new_f, new_g, new_h
+
+        if t in log_rounds:
+            round_logs.append({
+                "t": t,
+                "W[t]": W[t],
+                "K[t]": K[t],
+                "T1": T1,
+                "T2": T2,
+                "a": a, "b": b, "c": c, "d": d, "e": e, "f": f, "g": g, "h": h
+            })
+
+    H_out = [
+        (H[0] + a) & 0xFFFFFFFF, (H[1] + b) & 0xFFFFFFFF,
+        (H[2] + c) & 0xFFFFFFFF, (H[3] + d) & 0xFFFFFFFF,
+        (H[4] + e) & 0xFFFFFFFF, (H[5] + f) & 0xFFFFFFFF,
+        (H[6] + g) & 0xFFFFFFFF, (H[7] + h) & 0xFFFFFFFF
+    ]
+    return H_out, round_logs
+
+# --- Round traces (struct of arrays) -------------------------------------------
+# One packed uint32 column per field instead of a 13-key dict per round: a
+# traced round costs 52 bytes rather than several hundred.
+_WORD_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+TRACE_COLUMNS = ("t", "W[t]", "K[t]", "T1", "T2", "a", "b", "c", "d", "e", "f", "g", "h")
+
+class RoundTrace:
+    """Round logs of one block, one array('I') column per name in TRACE_COLUMNS
+    (array('Q') for the 64-bit SHA-512 family).
+
+    The compressor records rows into a single packed array; the per-field
+    columns are split out on first use of .columns. Indexing or iterating
+    yields per-round dicts built on demand (r["T1"], r["a"], ...), so
+    renderers written against the old list of dicts still work.
+    """
+    __slots__ = ("_rows", "_columns")
+
+    def __init__(self, columns: dict = None):
+        self._rows = None
+        if columns is None:
+            columns = {name: array(_WORD_TYPECODE) for name in TRACE_COLUMNS}
+        self._columns = columns
+
+    @classmethod
+    def from_rows(cls, rows: array) -> "RoundTrace":
+        """Wrap a row-major array of len(TRACE_COLUMNS)-value rows."""
+        trace = cls.__new__(cls)
+        trace._rows = rows
+        trace._columns = None
+        return trace
+
+    @property
+    def columns(self) -> dict:
+        if self._columns is None:
+            n = len(TRACE_COLUMNS)
+            self._columns = {name: self._rows[i::n] for i, name in enumerate(TRACE_COLUMNS)}
+            self._rows = None
+        return self._columns
+
+    @property
+    def itemsize(self) -> int:
+        """Bytes per stored word: 4 for SHA-224/256, 8 for the SHA-512 family."""
+        if self._columns is None:
+            return self._rows.itemsize
+        return self._columns["t"].itemsize
+
+    def __len__(self) -> int:
+        if self._columns is None:
+            return len(self._rows) // len(TRACE_COLUMNS)
+        return len(self._columns["t"])
+
+    def __getitem__(self, i: int) -> dict:
+        if self._columns is None:
+            n = len(TRACE_COLUMNS)
+            return dict(zip(TRACE_COLUMNS, self._rows[i*n:i*n+n]))
+        return {name: col[i] for name, col in self._columns.items()}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, RoundTrace):
+            return self.columns == other.columns
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"RoundTrace(rounds={[r['t'] for r in self]})"
+
+_NO_ROUNDS = RoundTrace()  # shared, never mutated: returned for untraced blocks
+
+# --- Unrolled compressor (generated once per variant) ---------------------------
+# Rather than moving eight variables every round, the generator renames them:
+# round t reads a..h from rotating slots v0..v7 and writes only the new d (=e)
+# and new h (=a). Sigma/Ch/Maj/rotr are inlined and intermediate sums are left
+# unmasked until they are stored, which is exact for the low word bits. The
+# same generator emits the 64-bit, 80-round SHA-512 family from its tables.
+_SLOTS = ["v0", "v1", "v2", "v3", "v4", "v5", "v6", "v7"]
+
+def _rotr_src(x: str, n: int, bits: int = 32) -> str:
+    return f"({x} >> {n} | {x} << {bits - n})"
+
+def _sigma_src(x: str, rot: Tuple[int, int, int], bits: int, shift_last: bool) -> str:
+    parts = [_rotr_src(x, rot[0], bits), _rotr_src(x, rot[1], bits)]
+    parts.append(f"({x} >> {rot[2]})" if shift_last else _rotr_src(x, rot[2], bits))
+    return " ^ ".join(parts)
+
+def build_schedule_source(variant: SHA2Variant = SHA256) -> str:
+    """Source of an unrolled message schedule: _schedule_unrolled(w16) -> W."""
+    bits, n, mask = variant.word_bits, variant.rounds, f"{variant.mask:#x}"
+    lines = ["def _schedule_unrolled(w):"]
+    lines.append("    " + ", ".join(f"w{t}" for t in range(16)) + " = w")
+    for t in range(16, n):
+        s0 = _sigma_src(f"w{t-15}", variant.sigma0, bits, True)
+        s1 = _sigma_src(f"w{t-2}", variant.sigma1, bits, True)
+        lines.append(f"    w{t} = (({s1}) + w{t-7} + ({s0}) + w{t-16}) & {mask}")
+    lines.append("    return [" + ", ".join(f"w{t}" for t in range(n)) + "]")
+    return "\n".join(lines) + "\n"
+
+def build_compressor_source(traced: bool, variant: SHA2Variant = SHA256) -> str:
+    """Source of a fully unrolled compressor for variant.
+
+    Untraced: _compress_unrolled(H, W) -> H_out.
+    Traced:   _compress_unrolled_traced(H, W, L) -> (H_out, RoundTrace), where
+    L is a per-round sequence of flags selecting the rounds to log.
+    """
+    bits, mask = variant.word_bits, f"{variant.mask:#x}"
+    kw = 2 + 2 * variant.word_bytes
+    name = "_compress_unrolled_traced" if traced else "_compress_unrolled"
+    args = "H, W, L" if traced else "H, W"
+    lines = [f"def {name}({args}):"]
+    lines.append("    " + ", ".join(_SLOTS) + " = H")
+    lines.append("    " + ", ".join(f"w{t}" for t in range(variant.rounds)) + " = W")
+    if traced:
+        lines.append("    rows = []")
+        lines.append("    rec = rows.extend")
+    for t in range(variant.rounds):
+        a, b, c, d, e, f, g, h = (_SLOTS[(i - t) % 8] for i in range(8))
+        S1 = _sigma_src(e, variant.Sigma1, bits, False)
+        S0 = _sigma_src(a, variant.Sigma0, bits, False)
+        k = f"{variant.K[t]:#0{kw}x}"
+        lines.append(f"    T1 = {h} + ({S1}) + ({g} ^ ({e} & ({f} ^ {g}))) + {k} + w{t}")
+        lines.append(f"    T2 = ({S0}) + (({a} & {b}) | ({c} & ({a} | {b})))")
+        lines.append(f"    {d} = ({d} + T1) & {mask}")
+        lines.append(f"    {h} = (T1 + T2) & {mask}")
+        if traced:
+            na, nb, nc, nd, ne, nf, ng, nh = (_SLOTS[(i - t - 1) % 8] for i in range(8))
+            lines.append(f"    if L[{t}]:")
+            lines.append(
+                f"        rec(({t}, w{t}, {k}, T1 & {mask}, T2 & {mask}, "
+                f"{na}, {nb}, {nc}, {nd}, {ne}, {nf}, {ng}, {nh}))"
+            )
+    # after 64 or 80 rounds (multiples of 8) the slots are back in a..h order
+    out = ", ".join(f"(H[{i}] + {slot}) & {mask}" for i, slot in enumerate(_SLOTS))
+    lines.append(f"    H_out = [{out}]")
+    lines.append("    return H_out, RoundTrace.from_rows(array(TYPECODE, rows))" if traced else "    return H_out")
+    return "\n".join(lines) + "\n"
+
+def _compile_cached(source: str, filename: str):
+    """compile(source) with the code object kept in __pycache__ between runs.
+
+    Compiling one variant's three generated functions takes ~30 ms, more than
+    the rest of startup; the marshalled code loads in well under 1 ms. Files
+    are keyed by a hash of the source, so a generator change never loads stale
+    code, and an unwritable __pycache__ just means compiling every time.
+    """
+    tag = sys.implementation.cache_tag
+    if tag is None:
+        return compile(source, filename, "exec")
+    key = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__",
+                        f"hash_demo.engine-{key}.{tag}.bin")
+    try:
+        with open(path, "rb") as fh:
+            return marshal.load(fh)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    code = compile(source, filename, "exec")
+    if not sys.dont_write_bytecode:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as fh:
+                marshal.dump(code, fh)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return code
+
+class SHA2Engine(NamedTuple):
+    variant: SHA2Variant
+    words: struct.Struct      # unpacks one block into 16 words
+    typecode: str             # array typecode holding one word
+    schedule: object          # w16 -> W
+    compress: object          # (H, W) -> H
+    compress_traced: object   # (H, W, flags) -> (H, RoundTrace)
+
+_ENGINES = {}
+
+def sha2_engine(variant: SHA2Variant = SHA256) -> SHA2Engine:
+    """Generated schedule/compressor functions for variant, built on first use."""
+    engine = _ENGINES.get(variant.name)
+    if engine is None:
+        typecode = _WORD_TYPECODE if variant.word_bits == 32 else "Q"
+        ns = {"array": array, "TYPECODE": typecode, "RoundTrace": RoundTrace}
+        tag = variant.name.lower()
+        exec(_compile_cached(build_schedule_source(variant), f"<{tag} schedule>"), ns)
+        for traced in (False, True):
+            exec(_compile_cached(build_compressor_source(traced, variant), f"<{tag} unrolled traced={traced}>"), ns)
+        engine = SHA2Engine(variant, _BLOCK_STRUCTS[variant.word_bits], typecode, ns["_schedule_unrolled"],
+                            ns["_compress_unrolled"], ns["_compress_unrolled_traced"])
+        _ENGINES[variant.name] = engine
+    return engine
+
+_schedule_unrolled, _compress_unrolled, _compress_unrolled_traced = sha2_engine(SHA256)[3:]
+
+def compress_block(H: List[int], W: List[int], rounds_to_log,
+                   variant: SHA2Variant = SHA256) -> Tuple[List[int], RoundTrace]:
+    """rounds_to_log: a count N (log rounds 0..N-1) or a collection of round indices."""
+    if variant is SHA256:
+        compress, compress_traced = _compress_unrolled, _compress_unrolled_traced
+    else:
+        engine = sha2_engine(variant)
+        compress, compress_traced = engine.compress, engine.compress_traced
+    if isinstance(rounds_to_log, int):
+        if rounds_to_log <= 0:
+            return compress(H, W), _NO_ROUNDS
+        rounds_to_log = range(rounds_to_log)
+    log_rounds = frozenset(rounds_to_log)
+    if not log_rounds:
+        return compress(H, W), _NO_ROUNDS
+    return compress_traced(H, W, [t in log_rounds for t in range(variant.rounds)])
+
+# --- Block / round selection --------------------------------------------------
+def parse_index_spec(spec: str) -> List[int]:
+    """'0,5,-1' or '60-63' -> list of indices (negatives count from the end)."""
+    out = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        m = re.fullmatch(r"(-?\d+)(?:-(-?\d+))?", part)
+        if m is None:
+            raise ValueError(f"bad index spec: {part!r}")
+        lo = int(m.group(1))
+        hi = int(m.group(2)) if m.group(2) is not None else lo
+        out.extend(range(lo, hi + 1))
+    return out
+
+def parse_rounds_arg(text: str) -> List[int]:
+    """A bare count N means rounds 0..N-1 (the original --rounds); otherwise an index spec.
+
+    The indices are returned unresolved: negatives count from the variant's
+    last round, so resolve them with resolve_indices(rounds, variant.rounds).
+    """
+    if text.isdigit():
+        return list(range(int(text)))
+    return parse_index_spec(text)
+
+def resolve_indices(indices, total: int) -> List[int]:
+    """Map negative indices against total and drop anything out of range."""
+    out = set()
+    for i in indices:
+        if i < 0:
+            i += total
+        if 0 <= i < total:
+            out.add(i)
+    return sorted(out)
+
+# --- Prefix midstate cache ----------------------------------------------------
+class MidstateCache:
+    """LRU map from 64-byte-aligned message prefixes to the chaining value H.
+
+    Prefixes are keyed by their (hashlib) SHA-256, so a key costs 32 bytes no
+    matter how long the prefix is. max_bytes bounds the cache using a rough
+    per-entry estimate; the least recently used prefixes are evicted first.
+    """
+    ENTRY_BYTES = 240  # key bytes + tuple of 8 ints + OrderedDict slot, roughly
+
+    def __init__(self, max_bytes: int = 64 << 20):
+        self.max_bytes = max_bytes
+        self.max_entries = max(1, max_bytes // self.ENTRY_BYTES)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.blocks_skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def longest_prefix(self, view, limit_blocks: int):
+        """Find the longest cached prefix of at most limit_blocks full blocks.
+
+        Returns (n_blocks, H, key_state) where key_state is a hashlib object
+        positioned after those n_blocks, ready to key the blocks that follow.
+        """
+        key_state = hashlib.sha256()
+        best = (0, H_INIT[:], key_state.copy())
+        entries = self._entries
+        for i in range(limit_blocks):
+            key_state.update(view[i*64:i*64+64])
+            key = key_state.digest()
+            H = entries.get(key)
+            if H is not None:
+                entries.move_to_end(key)
+                best = (i + 1, list(H), key_state.copy())
+        if best[0]:
+            self.hits += 1
+            self.blocks_skipped += best[0]
+        else:
+            self.misses += 1
+        return best
+
+    def store(self, key: bytes, H: List[int]) -> None:
+        entries = self._entries
+        entries[key] = tuple(H)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "blocks_skipped": self.blocks_skipped,
+            "entries": len(self._entries),
+            "approx_bytes": len(self._entries) * self.ENTRY_BYTES,
+            "max_bytes": self.max_bytes
+        }
+
+def iter_block_events(msg: bytes, blocks=(0,), rounds=range(8), cache: MidstateCache = None,
+                      variant: SHA2Variant = SHA256, profiler: StageProfiler = None) -> Iterator[dict]:
+    """Lazily run a SHA-2 variant (default SHA-256) over msg, yielding trace events on demand.
+
+    Yields {"type": "block", ...} for every selected block (raw block, full W,
+    chaining value and the selected rounds), then one {"type": "digest"} event.
+    blocks=None selects every block; negative indices count from the end.
+    Unselected blocks only pay for the compression itself. With a cache,
+    compression resumes after the longest cached prefix that precedes the
+    first selected block, and every newly computed full block is cached
+    (SHA-256 only: cached midstates are keyed by SHA-256 prefixes).
+
+    With a profiler every stage is timed into it. Traced blocks are then compressed twice (untraced, then
+    traced) so the cost of building round_logs shows up as its own
+    "trace_records" stage.
+    """
+    if cache is not None and variant is not SHA256:
+        raise ValueError(f"the midstate cache only supports SHA-256, not {variant.name}")
+    stage = profiler.stage if profiler is not None else _no_stage
+    engine = sha2_engine(variant)
+    schedule = engine.schedule
+    total = block_count_for(len(msg), variant)
+    selected = None if blocks is None else frozenset(resolve_indices(blocks, total))
+    rounds = frozenset(rounds)
+    H = list(variant.H_init)
+    start = 0
+    view = memoryview(msg).cast("B")
+    full_blocks = len(view) // variant.block_size
+    if cache is not None:
+        limit = full_blocks
+        if selected is None:
+            limit = 0
+        elif selected:
+            limit = min(limit, min(selected))
+        start, H, key_state = cache.longest_prefix(view, limit)
+    with stage("padding"):
+        tail = padded_tail(view, variant)
+    padded = iter_padded_blocks(view, start, variant, tail)
+    for i in range(start, total):
+        if profiler is not None:
+            profiler.current_block = i
+        with stage("split", i):
+            block, W0_15 = next(padded)
+        with stage("schedule", i):
+            W = schedule(W0_15)
+        traced = selected is None or i in selected
+        if not traced:
+            with stage("compress", i):
+                H, _ = compress_block(H, W, 0, variant)
+        else:
+            if profiler is not None:
+                with stage("compress", i):
+                    compress_block(H, W, 0, variant)
+                untraced = profiler.records[("compress", i)][1]
+            with stage("trace_records", i):
+                H, round_logs = compress_block(H, W, rounds, variant)
+                event = {
+                    "type": "block",
+                    "block_index": i,
+                    "block_count": total,
+                    "block": bytes(block),
+                    "W": array(engine.typecode, W),
+                    "H": H[:],
+                    "round_logs": round_logs
+                }
+            if profiler is not None:
+                # the traced run repeats the compression; keep only its excess here
+                rec = profiler.records[("trace_records", i)]
+                rec[1] = max(0.0, rec[1] - untraced)
+        if cache is not None and i < full_blocks:
+            key_state.update(block)
+            cache.store(key_state.digest(), H)
+        if traced:
+            yield event
+    if profiler is not None:
+        profiler.current_block = None
+    yield {
+        "type": "digest",
+        "block_count": total,
+        "digest": digest_bytes(H, variant).hex()
+    }
+
+def digest_sha2_with_logs(msg: bytes, variant: SHA2Variant = SHA256, rounds_to_log: int = 8,
+                          blocks=(0,), rounds=None, cache: MidstateCache = None):
+    """Collect iter_block_events into one result dict (selected blocks only)."""
+    if rounds is None:
+        rounds = range(rounds_to_log)
+    all_block_logs = []
+    for event in iter_block_events(msg, blocks=blocks, rounds=rounds, cache=cache, variant=variant):
+        if event["type"] == "block":
+            all_block_logs.append(event)
+        else:
+            out = event["digest"]
+
+    count = block_count_for(len(msg), variant)
+    return {
+        "input": msg,
+        "padded_len": count * variant.block_size,
+        "padding_hex": sha2_padding(len(msg), variant).hex(),
+        "block_count": count,
+        "blocks": all_block_logs,
+        "digest": out
+    }
+
+def digest_sha256_with_logs(msg: bytes, rounds_to_log: int = 8, blocks=(0,), rounds=None,
+                            cache: MidstateCache = None):
+    return digest_sha2_with_logs(msg, SHA256, rounds_to_log, blocks, rounds, cache)
+
+# --- Lockstep trace diff ----------------------------------------------------------
+# Two inputs are compressed block by block side by side and compared round by
+# round as each block's trace is produced, so at most one traced block per
+# input is alive at a time. Blocks whose bytes and chaining value are equal in
+# both inputs must give equal traces; they are compressed once and reported as
+# "identical" without per-round events.
+DIFF_FIELDS = ("W[t]", "a", "b", "c", "d", "e", "f", "g", "h")
+
+_popcount = getattr(int, "bit_count", None) or (lambda x: bin(x).count("1"))
+
+def iter_trace_diff(msg_a: bytes, msg_b: bytes, rounds=None, from_block: int = 0,
+                    variant: SHA2Variant = SHA256) -> Iterator[dict]:
+    """Run two messages through compress_block in lockstep, yielding diff events.
+
+    For every block index both inputs have, starting at from_block:
+      {"type": "round", "block_index", "t", "xor": {field: x}, "hamming": {field: n},
+       "state_bits": Hamming distance of a..h} per selected round (default: all),
+      then {"type": "block", "block_index", "H_xor", "hamming"} for the chaining value,
+    or a single {"type": "identical", "block_index"} when the block and the chaining
+    value are the same in both. Earlier blocks (and the surplus blocks of the longer
+    input) are only compressed. Ends with {"type": "digest", "digests", "block_counts"}.
+    """
+    engine = sha2_engine(variant)
+    schedule = engine.schedule
+    if rounds is None:
+        rounds = range(variant.rounds)
+    rounds = frozenset(rounds)
+    H_a = list(variant.H_init)
+    H_b = list(variant.H_init)
+    blocks_a = iter_padded_blocks(msg_a, 0, variant)
+    blocks_b = iter_padded_blocks(msg_b, 0, variant)
+    i = -1
+    while True:
+        # explicit next() rather than zip(), which would drop a block of the longer input
+        next_a = next(blocks_a, None)
+        next_b = next(blocks_b, None) if next_a is not None else None
+        if next_b is None:
+            break
+        i += 1
+        (block_a, w_a), (block_b, w_b) = next_a, next_b
+        if H_a == H_b and block_a == block_b:
+            H_a = H_b = engine.compress(H_a, schedule(w_a))
+            if i >= from_block:
+                yield {"type": "identical", "block_index": i}
+            continue
+        W_a, W_b = schedule(w_a), schedule(w_b)
+        if i < from_block:
+            H_a, H_b = engine.compress(H_a, W_a), engine.compress(H_b, W_b)
+            continue
+        H_a, trace_a = compress_block(H_a, W_a, rounds, variant)
+        H_b, trace_b = compress_block(H_b, W_b, rounds, variant)
+        for row_a, row_b in zip(trace_a, trace_b):
+            xor = {name: row_a[name] ^ row_b[name] for name in DIFF_FIELDS}
+            hamming = {name: _popcount(x) for name, x in xor.items()}
+            yield {
+                "type": "round",
+                "block_index": i,
+                "t": row_a["t"],
+                "xor": xor,
+                "hamming": hamming,
+                "state_bits": sum(hamming.values()) - hamming["W[t]"]
+            }
+        H_xor = [x ^ y for x, y in zip(H_a, H_b)]
+        yield {
+            "type": "block",
+            "block_index": i,
+            "H_xor": H_xor,
+            "hamming": sum(map(_popcount, H_xor))
+        }
+    # the shorter input has ended; finish the longer one untraced
+    counts = [block_count_for(len(msg_a), variant), block_count_for(len(msg_b), variant)]
+    if next_a is not None:
+        H_a = engine.compress(H_a, schedule(next_a[1]))
+    for _, w in blocks_a:
+        H_a = engine.compress(H_a, schedule(w))
+    for _, w in blocks_b:
+        H_b = engine.compress(H_b, schedule(w))
+    yield {
+        "type": "digest",
+        "block_counts": counts,
+        "digests": [digest_bytes(H_a, variant).hex(), digest_bytes(H_b, variant).hex()]
+    }
+
+# --- Binary trace export ----------------------------------------------------------
+# Layout (all little-endian):
+#   header   8s magic "SHA256TR", u16 version, u16 ncols, u16 name width,
+#            u16 word bytes, u64 nrows
+#   names    ncols ASCII column names, NUL-padded to the name width
+#   columns  ncols columns of nrows words, column-major
+# Words are uint32 for SHA-224/256 and uint64 for the SHA-512 family. Columns are
+# TRACE_FILE_COLUMNS: the block index, then TRACE_COLUMNS. Readers can mmap the
+# file and view each column in place (e.g. numpy.memmap with dtype "<u4",
+# offset=data_offset, shape=(ncols, nrows)).
+TRACE_MAGIC = b"SHA256TR"
+TRACE_VERSION = 2
+TRACE_FILE_COLUMNS = ("block",) + TRACE_COLUMNS
+_TRACE_HEADER = struct.Struct("<8sHHHHQ")
+_TRACE_NAME_WIDTH = 8
+
+def write_trace_file(path: str, events) -> int:
+    """Write the round logs of block events to path; returns the row count."""
+    columns = None
+    for event in events:
+        trace = event["round_logs"]
+        if columns is None:
+            typecode = event["W"].typecode
+            columns = {name: array(typecode) for name in TRACE_FILE_COLUMNS}
+        columns["block"].extend([event["block_index"]] * len(trace))
+        for name in TRACE_COLUMNS:
+            columns[name].extend(trace.columns[name])
+    if columns is None:
+        columns = {name: array(_WORD_TYPECODE) for name in TRACE_FILE_COLUMNS}
+    nrows = len(columns["block"])
+    with open(path, "wb") as fh:
+        fh.write(_TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(TRACE_FILE_COLUMNS),
+                                    _TRACE_NAME_WIDTH, columns["block"].itemsize, nrows))
+        for name in TRACE_FILE_COLUMNS:
+            fh.write(name.encode("ascii").ljust(_TRACE_NAME_WIDTH, b"\0"))
+        for name in TRACE_FILE_COLUMNS:
+            col = columns[name]
+            if sys.byteorder == "big":
+                col.byteswap()
+            col.tofile(fh)
+    return nrows
+
+def load_trace_file(path: str) -> dict:
+    """Memory-map a trace file written by write_trace_file.
+
+    Returns {column name: sequence of ints}. On little-endian hosts the columns
+    are zero-copy memoryviews into the mapping, which stays open until the last
+    of them is released; otherwise they are copies and the mapping is closed.
+    """
+    with open(path, "rb") as fh:
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < _TRACE_HEADER.size:
+        mapped.close()
+        raise ValueError(f"{path}: not a version {TRACE_VERSION} SHA-2 trace file")
+    magic, version, ncols, width, word_bytes, nrows = _TRACE_HEADER.unpack_from(mapped, 0)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or word_bytes not in (4, 8):
+        mapped.close()
+        raise ValueError(f"{path}: not a version {TRACE_VERSION} SHA-2 trace file")
+    names_at = _TRACE_HEADER.size
+    data_at = names_at + ncols * width
+    expected = data_at + ncols * nrows * word_bytes
+    if len(mapped) != expected:
+        size = len(mapped)
+        mapped.close()
+        raise ValueError(f"{path}: {size} bytes, but the header describes {expected} (truncated?)")
+    typecode = _WORD_TYPECODE if word_bytes == 4 else "Q"
+    names = [mapped[names_at + i*width:names_at + (i+1)*width].rstrip(b"\0").decode("ascii")
+             for i in range(ncols)]
+    zero_copy = sys.byteorder == "little" and typecode in ("I", "Q")
+    view = memoryview(mapped)
+    columns = {}
+    for i, name in enumerate(names):
+        raw = view[data_at + i*nrows*word_bytes:data_at + (i+1)*nrows*word_bytes]
+        if zero_copy:
+            columns[name] = raw.cast(typecode)
+        else:
+            col = array(typecode)
+            col.frombytes(raw)
+            raw.release()
+            if sys.byteorder == "big":
+                col.byteswap()
+            columns[name] = col
+    if not zero_copy:
+        view.release()
+        mapped.close()
+    return columns
+
+# --- Vectorized multi-message SHA-256 (NumPy) -------------------------------
+# Same round function as compress_block, but every working variable is a
+# uint32 array holding one lane per message; uint32 arithmetic wraps mod 2**32.
+def _np_rotr(x, n): return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+def _np_Sigma0(x): return _np_rotr(x, 2) ^ _np_rotr(x, 13) ^ _np_rotr(x, 22)
+def _np_Sigma1(x): return _np_rotr(x, 6) ^ _np_rotr(x, 11) ^ _np_rotr(x, 25)
+def _np_sigma0(x): return _np_rotr(x, 7) ^ _np_rotr(x, 18) ^ (x >> np.uint32(3))
+def _np_sigma1(x): return _np_rotr(x, 17) ^ _np_rotr(x, 19) ^ (x >> np.uint32(10))
+
+def _np_Ch(x, y, z):  return (x & y) ^ (~x & z)
+def _np_Maj(x, y, z): return (x & y) ^ (x & z) ^ (y & z)
+
+def compress_blocks_np(H, W16):
+    """Compress one block for N messages at once.
+
+    H is an (8, N) uint32 array of chaining values, W16 a (16, N) uint32
+    array of message words; returns the new (8, N) chaining values.
+    """
+    W = np.empty((64, W16.shape[1]), dtype=np.uint32)
+    W[:16] = W16
+    for t in range(16, 64):
+        W[t] = _np_sigma1(W[t-2]) + W[t-7] + _np_sigma0(W[t-15]) + W[t-16]
+
+    a, b, c, d, e, f, g, h = H
+    for t in range(64):
+        T1 = h + _np_Sigma1(e) + _np_Ch(e, f, g) + _K_NP[t] + W[t]
+        T2 = _np_Sigma0(a) + _np_Maj(a, b, c)
+        a, b, c, d, e, f, g, h = T1 + T2, a, b, c, d + T1, e, f, g
+    return H + np.stack([a, b, c, d, e, f, g, h])
+
+def sha256_batch_np(messages: List[bytes], lanes: int = 65536) -> List[str]:
+    """Hex digests of many messages, hashed in lockstep with NumPy.
+
+    Messages are grouped by padded block count so every lane in a group runs
+    the same number of compressions; groups are cut into `lanes`-sized slices
+    to bound memory. Output order matches input order.
+    """
+    if load_numpy() is None:
+        raise RuntimeError("NumPy is required for the vectorized engine (pip install numpy)")
+    groups = {}
+    for idx, m in enumerate(messages):
+        groups.setdefault((len(m) + 9 + 63) // 64, []).append(idx)
+
+    out = [None] * len(messages)
+    for nblocks, idxs in groups.items():
+        for lo in range(0, len(idxs), lanes):
+            part = idxs[lo:lo+lanes]
+            padded = b"".join(sha256_pad(messages[i]) for i in part)
+            words = np.frombuffer(padded, dtype=">u4").astype(np.uint32)
+            words = words.reshape(len(part), nblocks, 16)
+            H = np.repeat(_H_INIT_NP[:, None], len(part), axis=1)
+            for blk in range(nblocks):
+                H = compress_blocks_np(H, np.ascontiguousarray(words[:, blk, :].T))
+            digests = H.T.astype(">u4").tobytes()
+            for j, i in enumerate(part):
+                out[i] = digests[j*32:j*32+32].hex()
+    return out
+
+# --- Streaming SHA-2 ------------------------------------------------------------
+class SHA2Hasher:
+    """Incremental SHA-2 built on the generated compressors (hashlib-style API).
+
+    Only the chaining value and a partial-block tail are kept between update()
+    calls, so memory stays bounded no matter how much data is fed in.
+    Blocks listed in `blocks` (absolute, non-negative indices; none by
+    default, every block for None) are traced into `traced_blocks` with the
+    rounds selected by rounds/rounds_to_log, in the same shape as the block
+    events of iter_block_events.
+    """
+
+    def __init__(self, variant: SHA2Variant = SHA256, data: bytes = b"", rounds_to_log: int = 0,
+                 blocks=(), rounds=None):
+        self.variant = variant
+        self._engine = sha2_engine(variant)
+        self._H = list(variant.H_init)
+        self._tail = bytearray()
+        self._length = 0
+        self.block_count = 0
+        self.trace_blocks = None if blocks is None else frozenset(blocks)
+        self.trace_rounds = frozenset(range(rounds_to_log) if rounds is None else rounds)
+        self.traced_blocks = {}
+        if data:
+            self.update(data)
+
+    @property
+    def name(self) -> str:
+        return self.variant.hashlib_name
+
+    @property
+    def digest_size(self) -> int:
+        return self.variant.digest_size
+
+    @property
+    def block_size(self) -> int:
+        return self.variant.block_size
+
+    def _compress(self, H: List[int], block, words, index: int) -> List[int]:
+        W = self._engine.schedule(words)
+        if self.trace_blocks is not None and index not in self.trace_blocks:
+            return self._engine.compress(H, W)
+        H, round_logs = compress_block(H, W, self.trace_rounds, self.variant)
+        self.traced_blocks[index] = {
+            "type": "block",
+            "block_index": index,
+            "block": bytes(block),
+            "W": array(self._engine.typecode, W),
+            "H": H[:],
+            "round_logs": round_logs
+        }
+        return H
+
+    def update(self, data: bytes) -> None:
+        bs = self.variant.block_size
+        unpack = self._engine.words
+        view = memoryview(data).cast("B")
+        n = len(view)
+        self._length += n
+        pos = 0
+        if self._tail:
+            pos = min(bs - len(self._tail), n)
+            self._tail += view[:pos]
+            if len(self._tail) < bs:
+                return
+            self._H = self._compress(self._H, self._tail,
+                                     unpack.unpack(self._tail), self.block_count)
+            self.block_count += 1
+            self._tail = bytearray()
+        end = pos + (n - pos) // bs * bs
+        H = self._H
+        for i, words in zip(range(pos, end, bs), unpack.iter_unpack(view[pos:end])):
+            H = self._compress(H, view[i:i+bs], words, self.block_count)
+            self.block_count += 1
+        self._H = H
+        self._tail += view[end:]
+
+    @property
+    def bytes_processed(self) -> int:
+        return self._length
+
+    def digest(self) -> bytes:
+        bs = self.variant.block_size
+        tail = bytes(self._tail) + sha2_padding(self._length, self.variant)
+        H = self._H
+        for i, words in enumerate(self._engine.words.iter_unpack(tail)):
+            H = self._compress(H, tail[i*bs:i*bs+bs], words, self.block_count + i)
+        return digest_bytes(H, self.variant)
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+    @classmethod
+    def from_midstate(cls, H: List[int], length: int, tail: bytes = b"", variant: SHA2Variant = SHA256,
+                      blocks=(), rounds=None) -> "SHA2Hasher":
+        """Resume from a chaining value H after `length` bytes, len(tail) of them still buffered.
+
+        Nothing is recomputed: the next update() continues compressing from H.
+        Block indices (for tracing) continue from length // block_size.
+        """
+        if cls is SHA256Hasher and variant is not SHA256:
+            raise ValueError(f"SHA256Hasher cannot resume a {variant.name} state")
+        if len(H) != 8 or len(tail) != length % variant.block_size:
+            raise ValueError(f"inconsistent {variant.name} midstate: {len(H)} words, "
+                             f"{len(tail)}-byte tail after {length} bytes")
+        hasher = cls.__new__(cls)
+        SHA2Hasher.__init__(hasher, variant, blocks=blocks, rounds=rounds)
+        hasher._H = [h & variant.mask for h in H]
+        hasher._tail = bytearray(tail)
+        hasher._length = length
+        hasher.block_count = length // variant.block_size
+        return hasher
+
+    def export_state(self) -> bytes:
+        """Snapshot H, the byte count and the buffered tail as a compact blob (see from_state)."""
+        return pack_hasher_state(self.variant, self._H, self._length, bytes(self._tail))
+
+    @classmethod
+    def from_state(cls, blob: bytes, blocks=(), rounds=None) -> "SHA2Hasher":
+        """Rebuild a hasher from export_state() output, e.g. in another process."""
+        variant, H, length, tail = unpack_hasher_state(blob)
+        return cls.from_midstate(H, length, tail, variant, blocks, rounds)
+
+    def copy(self) -> "SHA2Hasher":
+        other = self.__class__.__new__(self.__class__)
+        other.variant = self.variant
+        other._engine = self._engine
+        other._H = self._H[:]
+        other._tail = bytearray(self._tail)
+        other._length = self._length
+        other.block_count = self.block_count
+        other.trace_blocks = self.trace_blocks
+        other.trace_rounds = self.trace_rounds
+        other.traced_blocks = dict(self.traced_blocks)
+        return other
+
+class SHA256Hasher(SHA2Hasher):
+    """SHA2Hasher fixed to SHA-256, with the original positional signature."""
+
+    def __init__(self, data: bytes = b"", rounds_to_log: int = 0, blocks=(), rounds=None):
+        super().__init__(SHA256, data, rounds_to_log, blocks, rounds)
+
+# --- Hasher state export ---------------------------------------------------------
+# Layout (big-endian):
+#   header   4s magic "SH2S", u8 version, u8 variant id, u64 bytes processed
+#   H        8 chaining words, 4 bytes each (SHA-224/256) or 8 (SHA-512 family)
+#   tail     the buffered partial block: bytes processed mod block size
+# A SHA-256 state is at most 109 bytes. Trace settings are not part of the state.
+STATE_MAGIC = b"SH2S"
+STATE_VERSION = 1
+_STATE_HEADER = struct.Struct(">4sBBQ")
+_VARIANT_IDS = {variant.name: i for i, variant in enumerate(SHA2_VARIANTS.values())}
+
+def pack_hasher_state(variant: SHA2Variant, H: List[int], length: int, tail: bytes = b"") -> bytes:
+    header = _STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION, _VARIANT_IDS[variant.name], length)
+    return header + digest_bytes(H, variant._replace(digest_size=8 * variant.word_bytes)) + tail
+
+def unpack_hasher_state(blob: bytes) -> Tuple[SHA2Variant, List[int], int, bytes]:
+    """Parse a state blob into (variant, H, bytes processed, tail); ValueError if malformed."""
+    blob = bytes(blob)
+    if len(blob) < _STATE_HEADER.size:
+        raise ValueError("hasher state is truncated")
+    magic, version, variant_id, length = _STATE_HEADER.unpack_from(blob)
+    if magic != STATE_MAGIC or version != STATE_VERSION or variant_id >= len(SHA2_VARIANTS):
+        raise ValueError(f"not a version {STATE_VERSION} hasher state")
+    variant = list(SHA2_VARIANTS.values())[variant_id]
+    wb = variant.word_bytes
+    body = blob[_STATE_HEADER.size:]
+    if len(body) != 8 * wb + length % variant.block_size:
+        raise ValueError(f"{variant.name} hasher state has the wrong size")
+    H = [int.from_bytes(body[i:i+wb], "big") for i in range(0, 8 * wb, wb)]
+    return variant, H, length, body[8 * wb:]
+
+def save_hasher_state(path: str, hasher: SHA2Hasher) -> None:
+    """Write hasher's state to path atomically (a crash leaves the previous checkpoint)."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(hasher.export_state())
+    os.replace(tmp, path)
+
+def load_hasher_state(path: str, blocks=(), rounds=None) -> SHA2Hasher:
+    with open(path, "rb") as fh:
+        return SHA2Hasher.from_state(fh.read(), blocks, rounds)
+
+def length_extend(digest_hex: str, original_len: int, suffix: bytes,
+                  variant: SHA2Variant = SHA256) -> Tuple[bytes, str]:
+    """Length-extension attack on an untruncated SHA-2 digest.
+
+    Given H(m) and len(m) only, returns (glue, digest) such that
+    digest == H(m + glue + suffix), where glue is m's padding. The digest is
+    the chaining value after m, so hashing resumes from it without m.
+    """
+    if variant.digest_size != 8 * variant.word_bytes:
+        raise ValueError(f"{variant.name} truncates its state; its digest cannot be extended")
+    raw = bytes.fromhex(digest_hex)
+    wb = variant.word_bytes
+    H = [int.from_bytes(raw[i:i+wb], "big") for i in range(0, len(raw), wb)]
+    glue = sha2_padding(original_len, variant)
+    hasher = SHA2Hasher.from_midstate(H, original_len + len(glue), variant=variant)
+    hasher.update(suffix)
+    return glue, hasher.hexdigest()
+
+# --- HMAC / PBKDF2 with precomputed pad midstates -----------------------------
+# HMAC(K, m) = H((K ^ opad) || H((K ^ ipad) || m)). Both pad blocks are a full
+# 64-byte block, so they are compressed once per key and every later HMAC starts
+# from those two chaining values. In PBKDF2 each iteration's message is a
+# 32-byte digest, so an iteration costs 2 compressions instead of 4.
+_IPAD = bytes(x ^ 0x36 for x in range(256))  # bytes.translate tables
+_OPAD = bytes(x ^ 0x5C for x in range(256))
+# Words 8..15 after a 32-byte digest that ends a 96-byte message (pad block + digest).
+_DIGEST_TAIL = [0x80000000, 0, 0, 0, 0, 0, 0, (64 + 32) * 8]
+_DIGEST_WORDS = struct.Struct(">8I")
+
+def _hmac_key_blocks(key: bytes) -> Tuple[bytes, bytes]:
+    if len(key) > 64:
+        key = SHA256Hasher(key).digest()
+    key = bytes(key).ljust(64, b"\0")
+    return key.translate(_IPAD), key.translate(_OPAD)
+
+def hmac_midstates(key: bytes) -> Tuple[List[int], List[int]]:
+    """Chaining values after compressing the ipad and opad key blocks."""
+    return tuple(_compress_unrolled(H_INIT, _schedule_unrolled(_BLOCK_WORDS.unpack(block)))
+                 for block in _hmac_key_blocks(key))
+
+def hmac_sha256(key: bytes, msg: bytes, midstates=None) -> bytes:
+    inner_H, outer_H = midstates or hmac_midstates(key)
+    inner = SHA256Hasher.from_midstate(inner_H, 64)
+    inner.update(msg)
+    W = _schedule_unrolled(list(_DIGEST_WORDS.unpack(inner.digest())) + _DIGEST_TAIL)
+    return digest_bytes(_compress_unrolled(outer_H, W))
+
+def pbkdf2_hmac_sha256(password: bytes, salt: bytes, iterations: int, dklen: int = 32,
+                       midstates: bool = True) -> bytes:
+    """PBKDF2-HMAC-SHA256 (RFC 8018) on the pure-Python engine.
+
+    The inner loop stays on 32-bit words: U is never converted back to bytes.
+    midstates=False recompresses both pad blocks in every iteration, which is
+    what a plain hash(ipad || ...) implementation does; it exists for comparison.
+    """
+    if iterations < 1:
+        raise ValueError("iterations must be at least 1")
+    if dklen < 1:
+        raise ValueError("dklen must be at least 1")
+    schedule, compress = _schedule_unrolled, _compress_unrolled
+    inner_H, outer_H = keys = hmac_midstates(password)
+    ipad_w, opad_w = (_BLOCK_WORDS.unpack(b) for b in _hmac_key_blocks(password))
+    tail = _DIGEST_TAIL
+    out = bytearray()
+    for index in range(1, -(-dklen // 32) + 1):
+        U = list(_DIGEST_WORDS.unpack(hmac_sha256(password, salt + index.to_bytes(4, "big"), keys)))
+        T = U
+        for _ in range(iterations - 1):
+            if not midstates:
+                inner_H = compress(H_INIT, schedule(ipad_w))
+                outer_H = compress(H_INIT, schedule(opad_w))
+            U = compress(outer_H, schedule(compress(inner_H, schedule(U + tail)) + tail))
+            T = [t ^ u for t, u in zip(T, U)]
+        out += _DIGEST_WORDS.pack(*T)
+    return bytes(out[:dklen])
+
+def calibrate_pbkdf2(target_seconds: float, derive=pbkdf2_hmac_sha256, probe_seconds: float = 0.2) -> int:
+    """Iteration count at which derive(password, salt, n) takes about target_seconds here.
+
+    Doubles a probe run until it takes probe_seconds (or the target, if
+    smaller), then scales linearly: PBKDF2 cost is linear in iterations.
+    """
+    probe_seconds = min(probe_seconds, target_seconds)
+    n = 16
+    while True:
+        start = time.perf_counter()
+        derive(b"calibration password", b"calibration salt", n)
+        elapsed = time.perf_counter() - start
+        if elapsed >= probe_seconds or n >= 1 << 30:
+            return max(1, round(n * target_seconds / elapsed))
+        n *= 2
+
+def reference_hash(variant: SHA2Variant):
+    """hashlib object for variant, or None if this OpenSSL build lacks it."""
+    try:
+        return hashlib.new(variant.hashlib_name)
+    except ValueError:
+        return None
+
+def iter_stream_events(stream, chunk_size: int = 1 << 20, blocks=(0,), rounds=range(8),
+                       variant: SHA2Variant = SHA256, hasher: SHA2Hasher = None,
+                       checkpoint=None, checkpoint_every: int = 64 << 20) -> Iterator[dict]:
+    """Hash a binary stream in chunk_size reads, yielding traced blocks as they complete.
+
+    Ends with a {"type": "digest"} event carrying our digest, hashlib's digest
+    of the same reads ("reference"), the byte counts and the hashing time in
+    seconds (time spent suspended at a yield is not counted). The reference is
+    None if hashlib lacks the variant, or when continuing a restored hasher
+    (hashlib cannot resume a midstate). checkpoint(hasher) is called every
+    checkpoint_every bytes read. Traced blocks are taken out of
+    hasher.traced_blocks as they are yielded, so tracing every block of a
+    long stream does not pile them up.
+    """
+    resumed = hasher is not None
+    if hasher is None:
+        hasher = SHA2Hasher(variant, blocks=blocks, rounds=rounds)
+    reference = None if resumed else reference_hash(variant)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    busy = 0.0
+    read = 0
+    next_checkpoint = checkpoint_every
+    mark = time.perf_counter()
+    while True:
+        n = stream.readinto(buf)
+        if not n:
+            break
+        hasher.update(view[:n])
+        if reference is not None:
+            reference.update(view[:n])
+        read += n
+        if checkpoint is not None and read >= next_checkpoint:
+            checkpoint(hasher)
+            next_checkpoint = read + checkpoint_every
+        if hasher.traced_blocks:
+            busy += time.perf_counter() - mark
+            traced = list(hasher.traced_blocks.values())
+            hasher.traced_blocks.clear()
+            yield from traced
+            mark = time.perf_counter()
+    ours = hasher.hexdigest()
+    busy += time.perf_counter() - mark
+    yield from hasher.traced_blocks.values()
+    yield {
+        "type": "digest",
+        "digest": ours,
+        "reference": reference.hexdigest() if reference is not None else None,
+        "bytes": hasher.bytes_processed,
+        "bytes_read": read,
+        "seconds": busy,
+        "hasher": hasher
+    }
+
+def hash_stream(stream, chunk_size: int = 1 << 20, blocks=(0,), rounds=range(8),
+                variant: SHA2Variant = SHA256):
+    """Hash a binary stream in chunk_size reads; also feeds hashlib for checking."""
+    for event in iter_stream_events(stream, chunk_size, blocks, rounds, variant):
+        pass
+    return event["hasher"], event["reference"], event["seconds"]
+
+# --- Producer/consumer pipeline ----------------------------------------------
+class EventPipeline:
+    """Run an event generator on a producer thread behind a bounded queue.
+
+    The renderer iterates the pipeline on the main thread; while it sleeps for
+    pacing the producer keeps computing, but never more than maxsize events
+    ahead, so memory stays bounded. Producer exceptions re-raise on the
+    consumer side.
+    """
+    _DONE = object()
+
+    def __init__(self, events, maxsize: int = 4):
+        self._queue = queue.Queue(max(1, maxsize))
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._produce, args=(events,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, events):
+        try:
+            for event in events:
+                if not self._put(event):
+                    return
+        except BaseException as exc:
+            self._error = exc
+        finally:
+            self._put(self._DONE)
+
+    def __iter__(self):
+        finished = False
+        try:
+            while True:
+                event = self._queue.get()
+                if event is self._DONE:
+                    finished = True
+                    if self._error is not None:
+                        raise self._error
+                    return
+                yield event
+        finally:
+            self.close(wait=finished)
+
+    def close(self, wait: bool = True):
+        """Stop the producer; with wait=False do not join it.
+
+        The producer only sees the stop flag between events, and in --file or
+        --stdin mode it can hash a long way between two traced blocks, so on
+        Ctrl+C or an early exit the daemon thread is left to die with the process.
+        """
+        self._stop.set()
+        if wait:
+            self._thread.join()
+
+# --- Output helpers with pacing ----------------------------------------------
+@_profiled_output
+def print_header(title: str, delay: float):
+    if _TIMELINE is not None:
+        _TIMELINE.section = title
+    if _use_rich():
+        console.rule(f"[bold]{title}[/bold]")
+    else:
+        print("\n" + "="*len(title))
+        print(title)
+        print("="*len(title))
+    _sleep(delay)
+
+@_profiled_output
+def print_kv(title: str, kv: List[Tuple[str, str]], delay: float, step: bool):
+    if _use_rich():
+        if title:
+            console.print(Panel.fit(title, style="bold"))
+        for k, v in kv:
+            console.print(f"[bold]{k}[/bold]: {v}")
+            _sleep(delay)
+    else:
+        if title: print(f"\n{title}:")
+        for k, v in kv:
+            print(f"  - {k}: {v}")
+            _sleep(delay)
+    _pause(step)
+
+# --- Bulk rendering (no per-line pacing) ---------------------------------------
+# When there is nothing to pace (zero delay) or nobody watching (stdout is not a
+# TTY), whole sections are formatted at once: the 32/64-bit values go through one
+# packed array -> hex conversion, plain text is written with a single write(),
+# and Rich gets one pre-built Text (no markup parsing) instead of a
+# console.print() per line. A rich Table was tried and measured slower than
+# this, besides truncating the a..h column on 80-column terminals.
+_ROUND_FIELDS = ("W[t]", "K[t]", "T1", "T2", "a", "b", "c", "d", "e", "f", "g", "h")
+_ROUND_LINE = "t=%02d  W=0x%s  K=0x%s  T1=0x%s  T2=0x%s  a..h=0x%s,0x%s,0x%s,0x%s,0x%s,0x%s,0x%s,0x%s"
+
+def _bulk_ok(each_delay: float) -> bool:
+    return each_delay <= 0 or not sys.stdout.isatty()
+
+def hex_words(values) -> List[str]:
+    """Big-endian hex for every word, via one packed conversion.
+
+    Arrays keep their own word size (8 digits for 'I', 16 for 'Q'); any other
+    sequence is treated as 32-bit words.
+    """
+    typecode = values.typecode if isinstance(values, array) else _WORD_TYPECODE
+    words = array(typecode, values)
+    if sys.byteorder == "little":
+        words.byteswap()
+    digits = words.tobytes().hex()
+    step = 2 * words.itemsize
+    return [digits[i:i+step] for i in range(0, len(digits), step)]
+
+def _hex_width(values) -> int:
+    return 2 * values.itemsize if hasattr(values, "itemsize") else 8
+
+def _print_schedule_bulk(W: List[int], limit: int):
+    hexes = hex_words(W[:limit])
+    title = f"Message Schedule W[0..{limit-1}]"
+    if _use_rich():
+        body = Text()
+        for i, x in enumerate(hexes):
+            body.append(f"W[{i:2d}]", style="dim")
+            body.append(f" = 0x{x}\n")
+        body.rstrip()
+        console.print(Panel.fit(title, style="bold"))
+        console.print(body)
+    else:
+        sys.stdout.write(f"\n{title}:\n" + "".join(f"  W[{i:2d}] = 0x{x}\n" for i, x in enumerate(hexes)))
+
+def _print_rounds_bulk(round_logs: List[dict], title: str):
+    cols = round_logs.columns
+    hexcols = [hex_words(cols[name]) for name in _ROUND_FIELDS]
+    rows = "\n".join(_ROUND_LINE % row for row in zip(cols["t"], *hexcols))
+    if _use_rich():
+        console.print(Panel.fit(title, style="bold"))
+        console.print(Text(rows))
+    else:
+        sys.stdout.write(f"\n{title}:\n" + rows + "\n")
+
+@_profiled_output
+def print_schedule(W: List[int], limit: int, each_delay: float, step: bool):
+    limit = max(0, min(len(W), limit))
+    if _bulk_ok(each_delay):
+        _print_schedule_bulk(W, limit)
+        _pause(step)
+        return
+    width = _hex_width(W)
+    if _use_rich():
+        console.print(Panel.fit(f"Message Schedule W[0..{limit-1}]", style="bold"))
+        for i in range(limit):
+            console.print(f"[dim]W[{i:2d}][/dim] = 0x{W[i]:0{width}x}")
+            _sleep(each_delay)
+    else:
+        print(f"\nMessage Schedule W[0..{limit-1}]:")
+        for i in range(limit):
+            print(f"  W[{i:2d}] = 0x{W[i]:0{width}x}")
+            _sleep(each_delay)
+    _pause(step)
+
+@_profiled_output
+def print_rounds(round_logs: List[dict], each_delay: float, step: bool):
+    if not round_logs:
+        return
+    title = describe_rounds(round_logs)
+    if _bulk_ok(each_delay):
+        _print_rounds_bulk(round_logs, title)
+        _pause(step)
+        return
+    if _use_rich():
+        console.print(Panel.fit(title, style="bold"))
+    else:
+        print(f"\n{title}:")
+    w = _hex_width(round_logs)
+    for r in round_logs:
+        line = (
+            f"t={r['t']:02d}  "
+            f"W=0x{r['W[t]']:0{w}x}  K=0x{r['K[t]']:0{w}x}  "
+            f"T1=0x{r['T1']:0{w}x}  T2=0x{r['T2']:0{w}x}  "
+            f"a..h=0x{r['a']:0{w}x},0x{r['b']:0{w}x},0x{r['c']:0{w}x},0x{r['d']:0{w}x},"
+            f"0x{r['e']:0{w}x},0x{r['f']:0{w}x},0x{r['g']:0{w}x},0x{r['h']:0{w}x}"
+        )
+        if _use_rich():
+            console.print(line)
+        else:
+            print(line)
+        _sleep(each_delay)
+    _pause(step)
+
+def describe_rounds(round_logs: List[dict]) -> str:
+    ts = [r["t"] for r in round_logs]
+    if ts == list(range(len(ts))):
+        return f"First {len(ts)} Rounds"
+    if len(ts) == 1:
+        return f"Round {ts[0]}"
+    if ts == list(range(ts[0], ts[-1] + 1)):
+        return f"Rounds {ts[0]}..{ts[-1]}"
+    return "Rounds " + ", ".join(str(t) for t in ts)
+
+def print_block_trace(event: dict, delay: float, schedule_delay: float, round_delay: float,
+                      schedule_limit: int, no_schedule: bool, step: bool):
+    i = event["block_index"]
+    print_header(f"Block {i}", delay)
+    print_kv(f"Block {i}", [("Bytes (hex)", event["block"].hex())], delay=delay, step=step)
+    if not no_schedule:
+        print_schedule(event["W"], limit=schedule_limit, each_delay=schedule_delay, step=step)
+    print_rounds(event["round_logs"], each_delay=round_delay, step=step)
+
+# --- Streaming walkthrough ---------------------------------------------------
+def run_stream(args, blocks: List[int], rounds: List[int]):
+    variant = SHA2_VARIANTS[args.algo]
+    rounds = resolve_indices(rounds, variant.rounds)
+    bs = variant.block_size
+    schedule_delay = args.schedule_delay if args.schedule_delay is not None else args.delay
+    round_delay = args.round_delay if args.round_delay is not None else args.delay
+    chunk_size = max(bs, args.chunk_size)
+
+    if args.stdin:
+        # Length is unknown up front, so blocks counted from the end cannot be traced.
+        source, fh, size = "<stdin>", sys.stdin.buffer, None
+        if blocks is not None:
+            blocks = [i for i in blocks if i >= 0]
+    else:
+        source, fh = args.file, open(args.file, "rb")
+        size = os.fstat(fh.fileno()).st_size
+        if blocks is not None:
+            blocks = resolve_indices(blocks, block_count_for(size, variant))
+
+    hasher = None
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        try:
+            hasher = load_hasher_state(args.checkpoint, blocks, rounds)
+        except ValueError as exc:
+            raise SystemExit(f"{args.checkpoint}: {exc}")
+        if hasher.variant is not variant:
+            raise SystemExit(f"{args.checkpoint}: checkpoint is {hasher.variant.name}, not {variant.name}")
+        if size is not None and size < hasher.bytes_processed:
+            raise SystemExit(f"{args.checkpoint}: {source} is shorter than the checkpointed "
+                             f"{hasher.bytes_processed} bytes")
+        _skip_input(fh, hasher.bytes_processed, chunk_size)
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = functools.partial(save_hasher_state, args.checkpoint)
+
+    def print_blocks(total: int):
+        padded_len = block_count_for(total, variant) * bs
+        print_header("Preprocessing", args.delay)
+        print_kv("Blocks", [
+            ("Padded length (bits)", str(padded_len * 8)),
+            ("Count", str(padded_len // bs)),
+            ("Block size", f"{bs * 8} bits ({bs} bytes)"),
+        ], delay=args.delay, step=args.step)
+
+    try:
+        print_header(f"{variant.name} Step-by-Step (streaming)", args.delay)
+        print_kv("Input", [
+            ("Source", source),
+            ("Size", f"{size} bytes" if size is not None else "unknown until EOF"),
+            ("Chunk size", f"{chunk_size} bytes"),
+        ] + ([("Resumed from", f"{args.checkpoint} ({hasher.bytes_processed} bytes already hashed)")]
+             if hasher is not None else []), delay=args.delay, step=args.step)
+        if size is not None:
+            print_blocks(size)
+
+        events = iter_stream_events(fh, chunk_size, blocks, rounds, variant, hasher,
+                                    checkpoint, int(args.checkpoint_mb * (1 << 20)))
+        if not args.no_pipeline:
+            events = EventPipeline(events, args.queue_size)
+        exported = []
+        for event in events:
+            if event["type"] == "digest":
+                final = event
+                break
+            if args.trace_out:
+                exported.append(event)
+            print_block_trace(event, args.delay, schedule_delay, round_delay,
+                              args.schedule_limit, args.no_schedule, args.step)
+    finally:
+        if fh is not sys.stdin.buffer:
+            fh.close()
+
+    total, elapsed = final["bytes"], final["seconds"]
+    ours, theirs = final["digest"], final["reference"]
+    rate = final["bytes_read"] / elapsed / 1e6 if elapsed > 0 else float("inf")
+    if size is None:
+        print_blocks(total)
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)  # finished: nothing left to resume
+    why = "resumed from a checkpoint" if hasher is not None else "hashlib lacks this algorithm"
+
+    print_header("Result", args.delay)
+    print_kv("Digest", [
+        ("Size", f"{total} bytes ({total*8} bits)"),
+        ("Computed (this script)", ours),
+        (f"hashlib.{variant.hashlib_name}", theirs or "unavailable"),
+        ("Verification", _verdict(ours, theirs, why)),
+        ("Throughput", f"{rate:.2f} MB/s ({elapsed:.3f} s)"),
+    ] + _export_trace(args.trace_out, exported), delay=args.delay, step=False)
+
+def _verdict(ours: str, theirs, why: str = "hashlib lacks this algorithm") -> str:
+    if theirs is None:
+        return f"n/a ({why})"
+    return "✅ MATCH" if ours == theirs else "❌ MISMATCH"
+
+def _skip_input(fh, n: int, chunk_size: int):
+    """Position fh after its first n bytes: seek files, read and discard pipes."""
+    if fh.seekable():
+        fh.seek(n)
+        return
+    while n > 0:
+        got = len(fh.read(min(n, chunk_size)))
+        if not got:
+            raise SystemExit(f"input ended before the checkpointed {n} bytes")
+        n -= got
+
+# --- HMAC / PBKDF2 demo -----------------------------------------------------
+def run_hmac(args, msg: str):
+    key = args.hmac.encode("utf-8")
+    data = msg.encode("utf-8")
+    ours = hmac_sha256(key, data).hex()
+    theirs = hmac_module.new(key, data, hashlib.sha256).hexdigest()
+    print_header("HMAC-SHA256", args.delay)
+    print_kv("HMAC", [
+        ("Key", repr(args.hmac)),
+        ("Message", repr(msg)),
+        ("Computed (this script)", ours),
+        ("hmac.new(..., sha256)", theirs),
+        ("Verification", _verdict(ours, theirs)),
+    ], delay=args.delay, step=False)
+
+def run_pbkdf2(args):
+    password = args.pbkdf2.encode("utf-8")
+    salt = bytes.fromhex(args.salt) if args.salt else os.urandom(16)
+    rows = []
+    iterations = args.iterations
+    if args.calibrate is not None:
+        iterations = calibrate_pbkdf2(args.calibrate)
+        rows.append(("Calibrated", f"{iterations} iterations ≈ {args.calibrate:g} s on this machine (this engine)"))
+
+    start = time.perf_counter()
+    ours = pbkdf2_hmac_sha256(password, salt, iterations, args.dklen)
+    elapsed = time.perf_counter() - start
+    theirs = hashlib.pbkdf2_hmac("sha256", password, salt, iterations, args.dklen)
+
+    # a short run without the pad midstates, for the per-iteration comparison
+    probe = min(iterations, 2000)
+    start = time.perf_counter()
+    pbkdf2_hmac_sha256(password, salt, probe, 32, midstates=False)
+    naive = (time.perf_counter() - start) / probe
+    per_iter = elapsed / (iterations * -(-args.dklen // 32))
+
+    print_header("PBKDF2-HMAC-SHA256", args.delay)
+    print_kv("Derivation", rows + [
+        ("Salt (hex)", salt.hex()),
+        ("Iterations", str(iterations)),
+        ("Derived key", ours.hex()),
+        ("hashlib.pbkdf2_hmac", theirs.hex()),
+        ("Verification", _verdict(ours.hex(), theirs.hex())),
+        ("Time", f"{elapsed:.3f} s ({1 / per_iter:,.0f} iterations/s)"),
+        ("Compressions / iteration", "2 with pad midstates, 4 without"),
+        ("Without midstates", f"{1 / naive:,.0f} iterations/s ({naive / per_iter:.2f}x slower)"),
+    ], delay=args.delay, step=False)
+
+# --- Length-extension demo ---------------------------------------------------
+def run_length_extension(args, msg: str):
+    """Forge H(secret || msg || glue || suffix) from H(secret || msg) and len(secret) alone."""
+    variant = SHA2_VARIANTS[args.algo]
+    secret = args.secret.encode("utf-8")
+    data = msg.encode("utf-8")
+    suffix = args.length_extension.encode("utf-8")
+    mac = hashlib.new(variant.hashlib_name, secret + data).hexdigest()  # what the server publishes
+
+    try:
+        glue, forged_mac = length_extend(mac, len(secret) + len(data), suffix, variant)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    forged = data + glue + suffix
+    check = hashlib.new(variant.hashlib_name, secret + forged).hexdigest()  # server-side verification
+
+    print_header(f"{variant.name} Length-Extension Attack", args.delay)
+    print_kv("Known to the attacker", [
+        ("Message", repr(msg)),
+        (f"MAC = {variant.hashlib_name}(secret || message)", mac),
+        ("Secret length", f"{len(secret)} bytes (the secret itself is never used)"),
+    ], delay=args.delay, step=args.step)
+    print_kv("Forgery", [
+        ("Glue padding (hex)", glue.hex()),
+        ("Appended", repr(args.length_extension)),
+        ("Forged message (hex)", forged.hex()),
+        ("Forged MAC (resumed from the old digest)", forged_mac),
+    ], delay=args.delay, step=args.step)
+    print_kv("Server check", [
+        (f"{variant.hashlib_name}(secret || forged message)", check),
+        ("Verification", "✅ FORGERY ACCEPTED" if check == forged_mac else "❌ MISMATCH"),
+    ], delay=args.delay, step=False)
+
+# --- Trace diff ----------------------------------------------------------------
+def _diff_input(text: str, is_file: bool):
+    """--diff operand: UTF-8 text, or with --diff-files a read-only mapping of the file."""
+    if not is_file:
+        return text.encode("utf-8")
+    with open(text, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return b""  # empty files cannot be mapped
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _diff_line(event: dict, width: int, state_bits: int) -> str:
+    xor, hamming = event["xor"], event["hamming"]
+    words = ",".join(f"0x{xor[name]:0{width}x}" for name in DIFF_FIELDS[1:])
+    return (f"t={event['t']:02d}  ΔW=0x{xor['W[t]']:0{width}x} ({hamming['W[t]']:2d})  "
+            f"Δa..h={words}  bits={event['state_bits']:3d}/{state_bits}")
+
+def run_diff(args, rounds: List[int]):
+    """Show how a difference between two inputs spreads through the rounds."""
+    variant = SHA2_VARIANTS[args.algo]
+    rounds = resolve_indices(rounds, variant.rounds)
+    round_delay = args.round_delay if args.round_delay is not None else args.delay
+    width = 2 * variant.word_bytes
+    state_bits = 8 * variant.word_bits
+    a, b = (_diff_input(x, args.diff_files) for x in args.diff)
+
+    print_header(f"{variant.name} Trace Diff", args.delay)
+    print_kv("Inputs", [
+        ("A", args.diff[0] if args.diff_files else repr(args.diff[0])),
+        ("B", args.diff[1] if args.diff_files else repr(args.diff[1])),
+        ("Sizes", f"{len(a)} / {len(b)} bytes"),
+        ("From block", str(args.from_block)),
+    ], delay=args.delay, step=args.step)
+
+    bulk = _bulk_ok(round_delay)
+    lines = []
+    current = None
+    same = None  # [first, last] of the current run of identical blocks
+
+    def emit(line: str):
+        if _use_rich():
+            console.print(Text(line))
+        else:
+            print(line)
+
+    def flush_same():
+        nonlocal same
+        if same is not None:
+            first, last = same
+            span = f"Block {first}" if first == last else f"Blocks {first}..{last}"
+            print_kv("", [(span, "identical (same bytes, same chaining value)")], delay=args.delay, step=False)
+            same = None
+
+    def start_block(i: int):
+        nonlocal current
+        if current != i:
+            current = i
+            flush_same()
+            print_header(f"Block {i}", args.delay)
+
+    events = timeline_events("diff", lambda: iter_trace_diff(a, b, rounds, args.from_block, variant))
+    for event in events:
+        kind = event["type"]
+        if kind == "identical":
+            i = event["block_index"]
+            same = [i, i] if same is None else [same[0], i]
+        elif kind == "round":
+            start_block(event["block_index"])
+            line = _diff_line(event, width, state_bits)
+            if bulk:
+                lines.append(line)  # written as one piece at the end of the block
+            else:
+                emit(line)
+                _sleep(round_delay)
+        elif kind == "block":
+            start_block(event["block_index"])
+            if lines:
+                emit("\n".join(lines))
+                lines = []
+            H_xor = ",".join(f"0x{x:0{width}x}" for x in event["H_xor"])
+            print_kv("", [(f"ΔH after block {current}", f"{H_xor} ({event['hamming']}/{state_bits} bits)")],
+                     delay=args.delay, step=args.step)
+        else:
+            final = event
+    flush_same()
+
+    print_header("Result", args.delay)
+    rows = []
+    for name, data, ours, count in zip("AB", (a, b), final["digests"], final["block_counts"]):
+        reference = reference_hash(variant)
+        theirs = None
+        if reference is not None:
+            reference.update(data)
+            theirs = reference.hexdigest()
+        rows += [(f"Digest {name} ({count} blocks)", ours), (f"Verification {name}", _verdict(ours, theirs))]
+    x = int(final["digests"][0], 16) ^ int(final["digests"][1], 16)
+    rows.append(("Digest Hamming distance", f"{_popcount(x)}/{variant.digest_size * 8} bits"))
+    print_kv("Digests", rows, delay=args.delay, step=False)
+    for data in (a, b):
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def _export_trace(path: str, events: List[dict]) -> List[Tuple[str, str]]:
+    """Write --trace-out if requested; returns the extra result line for print_kv."""
+    if not path:
+        return []
+    rows = write_trace_file(path, events)
+    return [("Trace file", f"{path} ({rows} rounds from {len(events)} blocks)")]
+
+# --- Vectorized engine check -------------------------------------------------
+def run_numpy_check(n: int, delay: float):
+    records = [f"user{i:06d}:password{i * 7919 % 100003}".encode("utf-8") for i in range(max(0, n))]
+    start = time.perf_counter()
+    ours = sha256_batch_np(records)
+    elapsed = time.perf_counter() - start
+    theirs = [hashlib.sha256(r).hexdigest() for r in records]
+    bad = sum(1 for x, y in zip(ours, theirs) if x != y)
+    rate = len(records) / elapsed if elapsed > 0 else float("inf")
+
+    print_header("SHA-256 NumPy Batch Engine", delay)
+    print_kv("Batch", [
+        ("Messages", str(len(records))),
+        ("Throughput", f"{rate:,.0f} msgs/s ({elapsed:.3f} s)"),
+        ("Verification", "✅ MATCH" if bad == 0 else f"❌ {bad} MISMATCHES"),
+    ], delay=delay, step=False)
+
+# --- SHA-2 variant comparison ------------------------------------------------
+def run_compare_algos(nbytes: int, delay: float):
+    """Time every SHA-2 variant's pure-Python engine on the same random input."""
+    data = os.urandom(max(0, nbytes))
+    rows = []
+    base = None
+    for variant in SHA2_VARIANTS.values():
+        sha2_engine(variant)  # keep code generation out of the timing
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            ours = SHA2Hasher(variant, data).hexdigest()
+            best = min(best, time.perf_counter() - start)
+        reference = reference_hash(variant)
+        if reference is not None:
+            reference.update(data)
+            reference = reference.hexdigest()
+        rate = len(data) / best / 1e6 if best > 0 else float("inf")
+        if variant is SHA256:
+            base = rate
+        rows.append((variant, rate, _verdict(ours, reference)))
+
+    print_header("SHA-2 Family: pure-Python throughput", delay)
+    print_kv(f"{len(data)} bytes, best of 3", [
+        (variant.name, f"{rate:.2f} MB/s ({rate / base:.2f}x SHA-256)  {verdict}")
+        for variant, rate, verdict in rows
+    ], delay=delay, step=False)
+
+# --- Bounded process-pool map ----------------------------------------------------
+def bounded_map(pool, fn, jobs, limit: int, ordered: bool = False) -> Iterator[Tuple[object, object]]:
+    """Run fn(*args) on pool for every (key, args) in jobs, yielding (key, result).
+
+    jobs is read lazily and at most limit jobs are in flight (or, when ordered,
+    finished but held back behind an earlier one), so memory does not grow
+    with the input. Unordered results are yielded as they complete, ordered
+    ones in job order. Closing the generator cancels the jobs not yet started.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+    jobs = iter(jobs)
+    pending = {}
+    done_early = {}
+    submitted = 0
+    next_out = 0
+    try:
+        while True:
+            # finished-but-unwritten results count too, so a slow head job cannot let them pile up
+            while len(pending) + len(done_early) < limit:
+                job = next(jobs, None)
+                if job is None:
+                    break
+                key, args = job
+                pending[pool.submit(fn, *args)] = (submitted, key)
+                submitted += 1
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                index, key = pending.pop(fut)
+                if ordered:
+                    done_early[index] = (key, fut.result())
+                else:
+                    yield key, fut.result()
+            while next_out in done_early:
+                yield done_early.pop(next_out)
+                next_out += 1
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+# --- Batch mode (process pool) -----------------------------------------------
+_WORKER_CACHE = None
+
+def _init_worker_cache(cache_bytes: int):
+    global _WORKER_CACHE
+    _WORKER_CACHE = MidstateCache(cache_bytes) if cache_bytes > 0 else None
+
+def _hash_lines(lines: List[bytes]) -> Tuple[List[str], Tuple[int, int]]:
+    cache = _WORKER_CACHE
+    before = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    digests = [digest_sha256_with_logs(m, rounds_to_log=0, blocks=(), cache=cache)["digest"]
+               for m in lines]
+    after = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    return digests, (after[0] - before[0], after[1] - before[1])
+
+def iter_line_chunks(path: str, chunk_lines: int) -> Iterator[List[bytes]]:
+    with open(path, "rb") as fh:
+        chunk = []
+        for line in fh:
+            chunk.append(line.rstrip(b"\r\n"))
+            if len(chunk) >= chunk_lines:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def hash_batch(path: str, workers: int, chunk_lines: int, ordered: bool,
+               cache_bytes: int = 0, cache_counts: List[int] = None):
+    """Yield (line, digest) pairs for every line of path, hashed across a pool.
+
+    At most 2 * workers chunks are in flight or held back (see bounded_map),
+    so memory does not grow with the file. Unordered results are yielded as
+    soon as their chunk completes; ordered results are held back until every
+    earlier chunk has been written. With cache_bytes > 0 every worker keeps its own MidstateCache; hit/miss
+    totals are accumulated into cache_counts ([hits, misses]) if given.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    jobs = ((lines, (lines,)) for lines in iter_line_chunks(path, max(1, chunk_lines)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker_cache,
+                             initargs=(cache_bytes,)) as pool:
+        for lines, (digests, (hits, misses)) in bounded_map(pool, _hash_lines, jobs, 2 * workers, ordered):
+            if cache_counts is not None:
+                cache_counts[0] += hits
+                cache_counts[1] += misses
+            yield from zip(lines, digests)
+
+def run_batch(args):
+    workers = args.workers or os.cpu_count() or 1
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    count = 0
+    cache_counts = [0, 0]
+    start = time.perf_counter()
+    try:
+        for line, digest in hash_batch(args.batch, workers, args.batch_chunk, args.ordered,
+                                       int(args.cache_mb * (1 << 20)), cache_counts):
+            out.write(f"{digest}  {line.decode('utf-8', errors='replace')}\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"{count} messages in {elapsed:.3f} s ({rate:,.0f} msgs/s, {workers} workers)",
+          file=sys.stderr)
+    if args.cache_mb > 0:
+        print(f"midstate cache: {cache_counts[0]} hits, {cache_counts[1]} misses", file=sys.stderr)
+
+# --- Merkle tree mode (process pool) ----------------------------------------
+# Leaves are fixed-size slices of the input; leaf digests are H(0x00 || leaf) and
+# inner nodes H(0x01 || left || right), as in RFC 6962, so a leaf can never be
+# passed off as an inner node. An odd node at the end of a level is promoted
+# unchanged. Unlike one SHA-256 stream, leaves are independent and hash in
+# parallel; after a change only the touched leaves and their paths need redoing.
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+def leaf_count_for(size: int, leaf_size: int) -> int:
+    return max(1, -(-size // leaf_size))
+
+def hash_leaf(data: bytes, engine: str = "hashlib") -> bytes:
+    if engine == "python":
+        hasher = SHA256Hasher(_LEAF_PREFIX)
+        hasher.update(data)
+        return hasher.digest()
+    h = hashlib.sha256(_LEAF_PREFIX)
+    h.update(data)
+    return h.digest()
+
+def hash_node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+def merkle_levels(leaf_digests: List[bytes]) -> List[List[bytes]]:
+    """All tree levels, leaves first; levels[-1] == [root]."""
+    levels = [list(leaf_digests)]
+    while len(levels[-1]) > 1:
+        below = levels[-1]
+        level = [hash_node(below[i], below[i+1]) for i in range(0, len(below) - 1, 2)]
+        if len(below) % 2:
+            level.append(below[-1])
+        levels.append(level)
+    return levels
+
+def merkle_update(levels: List[List[bytes]], index: int, digest: bytes) -> bytes:
+    """Replace leaf index and recompute only its path to the root; returns the new root."""
+    levels[0][index] = digest
+    for depth in range(1, len(levels)):
+        below = levels[depth - 1]
+        index //= 2
+        left = 2 * index
+        if left + 1 < len(below):
+            levels[depth][index] = hash_node(below[left], below[left + 1])
+        else:
+            levels[depth][index] = below[left]
+    return levels[-1][0]
+
+def _hash_leaf_range(path: str, leaf_size: int, indices: List[int], engine: str) -> Tuple[List[int], List[bytes]]:
+    digests = []
+    with open(path, "rb") as fh:
+        for i in indices:
+            fh.seek(i * leaf_size)
+            digests.append(hash_leaf(fh.read(leaf_size), engine))
+    return indices, digests
+
+def tree_hash_leaves(path: str, leaf_size: int, workers: int, indices=None, engine: str = "hashlib",
+                     leaves_per_task: int = 16) -> dict:
+    """Hash the given leaves of path (default: all) across a process pool.
+
+    Workers read their own leaves from the file, so only indices and digests
+    cross process boundaries; at most 2 * workers tasks are in flight.
+    Returns {leaf index: digest}.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    if indices is None:
+        indices = range(leaf_count_for(os.path.getsize(path), leaf_size))
+    indices = list(indices)
+    step = max(1, leaves_per_task)
+    jobs = ((None, (path, leaf_size, indices[i:i+step], engine)) for i in range(0, len(indices), step))
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for _, result in bounded_map(pool, _hash_leaf_range, jobs, 2 * workers):
+            results.update(zip(*result))
+    return results
+
+def load_tree_manifest(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+def save_tree_manifest(path: str, size: int, leaf_size: int, levels: List[List[bytes]]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({
+            "size": size,
+            "leaf_size": leaf_size,
+            "root": levels[-1][0].hex(),
+            "leaves": [d.hex() for d in levels[0]]
+        }, fh)
+    os.replace(tmp, path)
+
+def run_tree(args):
+    workers = args.workers or os.cpu_count() or 1
+    leaf_size = max(1, args.leaf_size)
+    size = os.path.getsize(args.file)
+    count = leaf_count_for(size, leaf_size)
+
+    manifest = None
+    if args.tree_manifest and os.path.exists(args.tree_manifest):
+        manifest = load_tree_manifest(args.tree_manifest)
+        if manifest["leaf_size"] != leaf_size:
+            raise SystemExit(f"{args.tree_manifest}: leaf size is {manifest['leaf_size']}, not {leaf_size}")
+    if args.tree_leaves is not None and (manifest is None or manifest["size"] != size):
+        raise SystemExit("--tree-leaves needs a --tree-manifest of the same-sized file")
+
+    start = time.perf_counter()
+    if args.tree_leaves is not None:
+        # incremental: rehash only the named leaves, patch their paths
+        try:
+            indices = resolve_indices(parse_index_spec(args.tree_leaves), count)
+        except ValueError as exc:
+            raise SystemExit(f"--tree-leaves: {exc}")
+        levels = merkle_levels([bytes.fromhex(d) for d in manifest["leaves"]])
+        fresh = tree_hash_leaves(args.file, leaf_size, workers, indices, args.tree_engine)
+        for i, digest in fresh.items():
+            merkle_update(levels, i, digest)
+        hashed = len(fresh)
+    else:
+        fresh = tree_hash_leaves(args.file, leaf_size, workers, engine=args.tree_engine)
+        levels = merkle_levels([fresh[i] for i in range(count)])
+        hashed = count
+    elapsed = time.perf_counter() - start
+    hashed_bytes = min(size, hashed * leaf_size)
+    rate = hashed_bytes / elapsed / 1e6 if elapsed > 0 else float("inf")
+
+    rows = [
+        ("Source", args.file),
+        ("Size", f"{size} bytes"),
+        ("Leaf size", f"{leaf_size} bytes"),
+        ("Leaves", f"{count} ({hashed} hashed, engine: {args.tree_engine})"),
+        ("Depth", str(len(levels) - 1)),
+        ("Workers", str(workers)),
+        ("Root", levels[-1][0].hex()),
+        ("Throughput", f"{rate:.2f} MB/s ({elapsed:.3f} s)"),
+    ]
+    if manifest is not None:
+        old = manifest["leaves"]
+        changed = [i for i, d in enumerate(levels[0]) if i >= len(old) or old[i] != d.hex()]
+        shown = ", ".join(str(i) for i in changed[:20]) + (" ..." if len(changed) > 20 else "")
+        rows.append(("Changed leaves", f"{len(changed)}" + (f": {shown}" if changed else "")))
+        rows.append(("Root vs. manifest", "✅ UNCHANGED" if manifest["root"] == levels[-1][0].hex()
+                     else "❌ CHANGED"))
+    if args.tree_manifest:
+        save_tree_manifest(args.tree_manifest, size, leaf_size, levels)
+        rows.append(("Manifest", args.tree_manifest))
+
+    print_header("SHA-256 Merkle Tree", args.delay)
+    print_kv("Tree", rows, delay=args.delay, step=False)
+
+# --- Hashing service (--serve) -------------------------------------------------
+# One long-lived process keeps the interpreter, Rich and the generated engines
+# warm. It speaks a small subset of HTTP/1.1 (keep-alive, Content-Length
+# bodies) over localhost TCP or a Unix socket:
+#   GET  /health                        -> {"status": "ok", ...}
+#   POST /hash   {"messages": [...]}    -> {"digests": [...]}  ("message" -> "digest")
+#   POST /trace  {"message": ...}       -> chunked NDJSON, one trace event per line
+# Bodies may set "algo" (default sha256) and "encoding" ("utf-8" or "hex");
+# /trace also takes "blocks" and "rounds" in the CLI's syntax ("all" blocks too).
+# /hash requests arriving within a short window are merged into one job for the
+# worker pool; SHA-256 hash batches go through the NumPy lanes when available.
+# /trace runs iter_block_events on a thread per request and writes each event
+# as soon as it is produced, so neither process holds the whole trace.
+SERVE_MAX_BODY = 64 << 20
+_SERVE_NP_MIN = 32  # below this many messages the NumPy setup costs more than it saves
+
+def _init_serve_worker(cache_bytes: int):
+    _init_worker_cache(cache_bytes)
+    for variant in SHA2_VARIANTS.values():
+        sha2_engine(variant)  # generate every engine before the first request
+
+def _serve_hash_job(requests: List[List[Tuple[str, bytes]]]) -> List[List[str]]:
+    """Worker: hex digests for a batch of requests, each a list of (algo, message)."""
+    items = [item for request in requests for item in request]
+    digests = [None] * len(items)
+    plain = [i for i, (algo, _) in enumerate(items) if algo == "sha256"]
+    if len(plain) >= _SERVE_NP_MIN and load_numpy() is not None:
+        for i, digest in zip(plain, sha256_batch_np([items[i][1] for i in plain])):
+            digests[i] = digest
+    for i, (algo, msg) in enumerate(items):
+        if digests[i] is None:
+            cache = _WORKER_CACHE if algo == "sha256" else None
+            digests[i] = digest_sha2_with_logs(msg, SHA2_VARIANTS[algo], 0, blocks=(), cache=cache)["digest"]
+    out = []
+    for request in requests:
+        out.append(digests[:len(request)])
+        del digests[:len(request)]
+    return out
+
+def trace_event_json(event: dict) -> dict:
+    """An iter_block_events event as plain JSON types (round logs as columns)."""
+    if event["type"] != "block":
+        return dict(event)
+    return {
+        "type": "block",
+        "block_index": event["block_index"],
+        "block_count": event["block_count"],
+        "block": event["block"].hex(),
+        "W": event["W"].tolist(),
+        "H": event["H"],
+        "round_logs": {name: col.tolist() for name, col in event["round_logs"].columns.items()}
+    }
+
+def _next_trace_line(events) -> bytes:
+    """The next event of a /trace stream as an NDJSON line, or b"" at the end (runs on a thread)."""
+    event = next(events, None)
+    return b"" if event is None else (json.dumps(trace_event_json(event)) + "\n").encode("utf-8")
+
+class RequestBatcher:
+    """Collect payloads submitted within `window` seconds (at most max_items) and
+    run them as one job(payloads) -> results call on an executor."""
+
+    def __init__(self, executor, job, window: float, max_items: int):
+        self.executor = executor
+        self.job = job
+        self.window = window
+        self.max_items = max(1, max_items)
+        self.batches = 0
+        self.items = 0
+        self._payloads = []
+        self._futures = []
+        self._timer = None
+
+    async def submit(self, payload):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._payloads.append(payload)
+        self._futures.append(fut)
+        if len(self._payloads) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        import asyncio
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        payloads, futures = self._payloads, self._futures
+        self._payloads, self._futures = [], []
+        self.batches += 1
+        self.items += len(payloads)
+        job = asyncio.get_running_loop().run_in_executor(self.executor, self.job, payloads)
+        job.add_done_callback(functools.partial(self._resolve, futures))
+
+    @staticmethod
+    def _resolve(futures, job):
+        import asyncio
+        exc = job.exception() if not job.cancelled() else asyncio.CancelledError()
+        results = job.result() if exc is None else [None] * len(futures)
+        for fut, result in zip(futures, results):
+            if fut.done():  # the client went away
+                continue
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                 413: "Payload Too Large", 500: "Internal Server Error"}
+
+async def _read_http_request(reader):
+    """(method, path, version, headers, body), or None when the client closed the connection."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise _HTTPError(400, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise _HTTPError(400, "bad Content-Length")
+    if length > SERVE_MAX_BODY:
+        raise _HTTPError(413, f"body larger than {SERVE_MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), target.split("?", 1)[0], version, headers, body
+
+def _http_head(status: int, content_type: str, keep_alive: bool, length: int = None) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines.append(f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def _send_json(writer, status: int, obj, keep_alive: bool):
+    data = json.dumps(obj).encode("utf-8")
+    writer.write(_http_head(status, "application/json", keep_alive, len(data)) + data)
+    await writer.drain()
+
+def _request_message(value, encoding: str) -> bytes:
+    if not isinstance(value, str):
+        raise _HTTPError(400, "messages must be strings")
+    if encoding == "hex":
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            raise _HTTPError(400, "bad hex message")
+    return value.encode("utf-8")
+
+def _request_algo(body: dict) -> str:
+    algo = body.get("algo", "sha256")
+    if algo not in SHA2_VARIANTS:
+        raise _HTTPError(400, f"unknown algo {algo!r} (one of {', '.join(sorted(SHA2_VARIANTS))})")
+    return algo
+
+class HashService:
+    """Routes HTTP requests: batched hash jobs on a warm worker pool, streamed traces."""
+
+    def __init__(self, executor, workers: int, window: float, max_batch: int):
+        self.workers = workers
+        self.hashes = RequestBatcher(executor, _serve_hash_job, window, max_batch)
+        self.requests = 0
+        self.traces = 0
+
+    async def handle(self, reader, writer):
+        import asyncio
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await _read_http_request(reader)
+                    if request is None:
+                        break
+                    method, path, version, headers, body = request
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                    self.requests += 1
+                    await self.dispatch(method, path, body, writer, keep_alive)
+                except _HTTPError as exc:
+                    await _send_json(writer, exc.status, {"error": str(exc)}, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, path: str, body: bytes, writer, keep_alive: bool):
+        routes = {"/health": "GET", "/hash": "POST", "/trace": "POST"}
+        if path not in routes:
+            raise _HTTPError(404, f"no such endpoint {path!r} (try /health, /hash or /trace)")
+        if method != routes[path]:
+            raise _HTTPError(405, f"{path} expects {routes[path]}")
+        if path == "/health":
+            await _send_json(writer, 200, self.stats(), keep_alive)
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise _HTTPError(400, "body is not JSON")
+        if not isinstance(request, dict):
+            raise _HTTPError(400, "body must be a JSON object")
+        algo = _request_algo(request)
+        encoding = request.get("encoding", "utf-8")
+        if encoding not in ("utf-8", "hex"):
+            raise _HTTPError(400, "encoding must be utf-8 or hex")
+        if path == "/hash":
+            await self.hash(request, algo, encoding, writer, keep_alive)
+        else:
+            await self.trace(request, algo, encoding, writer, keep_alive)
+
+    async def hash(self, request: dict, algo: str, encoding: str, writer, keep_alive: bool):
+        single = "messages" not in request
+        values = [request.get("message", "")] if single else request["messages"]
+        if not isinstance(values, list):
+            raise _HTTPError(400, "messages must be a list")
+        messages = [(algo, _request_message(v, encoding)) for v in values]
+        try:
+            digests = await self.hashes.submit(messages)
+        except Exception as exc:
+            raise _HTTPError(500, f"hashing failed: {exc}")
+        await _send_json(writer, 200, {"digest": digests[0]} if single else {"digests": digests}, keep_alive)
+
+    async def trace(self, request: dict, algo: str, encoding: str, writer, keep_alive: bool):
+        msg = _request_message(request.get("message", ""), encoding)
+        try:
+            blocks = str(request.get("blocks", "0"))
+            blocks = None if blocks == "all" else parse_index_spec(blocks)
+            rounds = resolve_indices(parse_rounds_arg(str(request.get("rounds", "8"))), SHA2_VARIANTS[algo].rounds)
+        except ValueError as exc:
+            raise _HTTPError(400, str(exc))
+        import asyncio
+        loop = asyncio.get_running_loop()
+        self.traces += 1
+        # one event per hop: the next block is computed only once this one is written
+        events = iter_block_events(msg, blocks, rounds, variant=SHA2_VARIANTS[algo])
+        try:
+            line = await loop.run_in_executor(None, _next_trace_line, events)
+        except Exception as exc:
+            raise _HTTPError(500, f"tracing failed: {exc}")
+        writer.write(_http_head(200, "application/x-ndjson", keep_alive))
+        while line:
+            writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()  # a slow reader holds back only its own stream
+            line = await loop.run_in_executor(None, _next_trace_line, events)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def stats(self) -> dict:
+        return {
+            "status": "ok",
+            "algos": sorted(SHA2_VARIANTS),
+            "workers": self.workers,
+            "numpy": load_numpy() is not None,
+            "requests": self.requests,
+            "hash_batches": self.hashes.batches,
+            "hash_requests": self.hashes.items,
+            "trace_requests": self.traces
+        }
+
+def parse_serve_address(text: str) -> Tuple[str, object]:
+    """'PORT', 'HOST:PORT' -> ("tcp", (host, port)); a path or 'unix:PATH' -> ("unix", path)."""
+    if text.startswith("unix:"):
+        return "unix", text[5:]
+    if "/" in text:
+        return "unix", text
+    host, _, port = text.rpartition(":")
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"bad --serve address {text!r}: expected PORT, HOST:PORT or a socket path")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+async def _serve_forever(service: HashService, address: Tuple[str, object]):
+    import asyncio
+    kind, where = address
+    if kind == "unix":
+        if os.path.exists(where) and stat.S_ISSOCK(os.stat(where).st_mode):
+            os.remove(where)  # stale socket from an earlier run
+        server = await asyncio.start_unix_server(service.handle, path=where)
+        shown = where
+    else:
+        server = await asyncio.start_server(service.handle, *where)
+        shown = "http://%s:%d" % server.sockets[0].getsockname()[:2]
+    print(f"Serving on {shown} ({service.workers} workers); Ctrl+C to stop", file=sys.stderr, flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if kind == "unix" and os.path.exists(where):
+            os.remove(where)
+
+def run_serve(args):
+    import asyncio  # only the service needs these (~90 ms to import together)
+    from concurrent.futures import ProcessPoolExecutor
+    try:
+        address = parse_serve_address(args.serve)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    if address[0] == "unix" and not hasattr(asyncio, "start_unix_server"):
+        raise SystemExit("Unix sockets are not available on this platform; use --serve PORT")
+    workers = args.workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_serve_worker,
+                             initargs=(int(args.cache_mb * (1 << 20)),)) as pool:
+        service = HashService(pool, workers, args.serve_batch_ms / 1000, args.serve_max_batch)
+        try:
+            asyncio.run(_serve_forever(service, address))
+        except KeyboardInterrupt:
+            pass
+
+# --- CLI ---------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pretty SHA-256 (and SHA-2 family) step-by-step demo with pacing."
+    )
+    parser.add_argument("message", nargs="?", default=None,
+                        help="Message to hash. If omitted, you'll be prompted.")
+    parser.add_argument("--algo", choices=sorted(SHA2_VARIANTS), default="sha256",
+                        help="SHA-2 variant for the walkthrough and --file/--stdin (default: sha256).")
+    parser.add_argument("--compare-algos", type=int, nargs="?", const=1 << 20, default=None, metavar="BYTES",
+                        help="Time every SHA-2 variant on BYTES random bytes (default: 1 MiB) and exit.")
+    parser.add_argument("--rounds", default="8",
+                        help="Rounds to display per traced block: a count N (rounds 0..N-1, default: 8) "
+                             "or a spec such as 60-63 or 0,1,-1.")
+    parser.add_argument("--blocks", default="0",
+                        help="Blocks to trace, e.g. 0,5,-1, 2-4 or all (negatives count from the end; default: 0).")
+    parser.add_argument("--no-schedule", action="store_true",
+                        help="Do not print the message schedule table.")
+    parser.add_argument("--schedule-limit", type=int, default=16,
+                        help="How many W[t] entries to show (default: 16; max 64, or 80 for SHA-384/512).")
+    parser.add_argument("--plain", action="store_true",
+                        help="Force plain text (ignore Rich if installed).")
+
+    # streaming input
+    parser.add_argument("--file", default=None,
+                        help="Hash a file in buffered chunks instead of a message.")
+    parser.add_argument("--stdin", action="store_true",
+                        help="Hash bytes read from standard input in buffered chunks.")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20,
+                        help="Read size in bytes for --file/--stdin (default: 1 MiB).")
+    parser.add_argument("--checkpoint", default=None, metavar="FILE",
+                        help="For --file/--stdin: save the hasher state to FILE periodically and resume "
+                             "from it if it exists (removed when hashing completes).")
+    parser.add_argument("--checkpoint-mb", type=float, default=64,
+                        help="Bytes read between checkpoints, in MB (default: 64).")
+    parser.add_argument("--length-extension", default=None, metavar="SUFFIX",
+                        help="Demo: forge the MAC of message+padding+SUFFIX from H(secret || message) alone.")
+    parser.add_argument("--secret", default="s3cr3t-key",
+                        help="Secret prefix used by the server in --length-extension (default: s3cr3t-key).")
+    parser.add_argument("--hmac", default=None, metavar="KEY",
+                        help="Compute HMAC-SHA256 of the message under KEY (pad blocks compressed once).")
+    parser.add_argument("--pbkdf2", default=None, metavar="PASSWORD",
+                        help="Derive a PBKDF2-HMAC-SHA256 key from PASSWORD and verify against hashlib.")
+    parser.add_argument("--salt", default=None,
+                        help="Salt for --pbkdf2, in hex (default: 16 random bytes).")
+    parser.add_argument("--iterations", type=int, default=10000,
+                        help="PBKDF2 iteration count (default: 10000).")
+    parser.add_argument("--dklen", type=int, default=32,
+                        help="PBKDF2 derived key length in bytes (default: 32).")
+    parser.add_argument("--calibrate", type=float, default=None, metavar="SECONDS",
+                        help="Pick the --pbkdf2 iteration count that takes SECONDS on this machine.")
+    parser.add_argument("--diff", nargs=2, default=None, metavar=("A", "B"),
+                        help="Compare two inputs round by round: XOR and Hamming distance of W[t] and a..h "
+                             "for the --rounds of every block that differs.")
+    parser.add_argument("--diff-files", action="store_true",
+                        help="Treat the --diff operands as file paths (memory-mapped) instead of text.")
+    parser.add_argument("--from-block", type=int, default=0,
+                        help="With --diff: only compare blocks from this index on; earlier ones are just compressed.")
+    parser.add_argument("--numpy-check", type=int, default=None, metavar="N",
+                        help="Hash N short records with the NumPy engine, verify against hashlib and report msgs/s.")
+
+    # batch mode
+    parser.add_argument("--batch", default=None, metavar="FILE",
+                        help="Hash every line of FILE (one message per line) across a process pool.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --batch and --serve (default: CPU count).")
+    parser.add_argument("--batch-chunk", type=int, default=256,
+                        help="Lines per task submitted to the pool (default: 256).")
+    parser.add_argument("--ordered", action="store_true",
+                        help="Write --batch results in input order instead of as they finish.")
+    parser.add_argument("--output", default=None,
+                        help="Write --batch results to this file instead of stdout.")
+    parser.add_argument("--cache-mb", type=float, default=0,
+                        help="Per-worker prefix midstate cache size in MB for --batch and --serve (default: off).")
+
+    # service mode
+    parser.add_argument("--serve", default=None, metavar="ADDR",
+                        help="Run a hashing service: PORT or HOST:PORT (HTTP, default host 127.0.0.1) "
+                             "or a Unix socket path. Endpoints: GET /health, POST /hash, POST /trace.")
+    parser.add_argument("--serve-batch-ms", type=float, default=2.0,
+                        help="With --serve: merge /hash requests arriving within this many ms into one job (default: 2).")
+    parser.add_argument("--serve-max-batch", type=int, default=256,
+                        help="With --serve: most /hash requests merged into one job (default: 256).")
+
+    # tree mode
+    parser.add_argument("--tree", action="store_true",
+                        help="With --file: compute a SHA-256 Merkle root over fixed-size leaves across a process pool.")
+    parser.add_argument("--leaf-size", type=int, default=1 << 20,
+                        help="Leaf size in bytes for --tree (default: 1 MiB).")
+    parser.add_argument("--tree-engine", choices=("hashlib", "python"), default="hashlib",
+                        help="Leaf hashing engine for --tree: hashlib (fast) or this script's engine.")
+    parser.add_argument("--tree-manifest", default=None, metavar="FILE",
+                        help="Leaf digests for --tree: compared against if FILE exists, then (re)written.")
+    parser.add_argument("--tree-leaves", default=None, metavar="SPEC",
+                        help="With --tree-manifest: rehash only these leaves (e.g. 3,10-12) and update the root.")
+
+    # pacing options
+    parser.add_argument("--delay", type=float, default=1,
+                        help="Base delay (seconds) between printed items (default: 0.35).")
+    parser.add_argument("--schedule-delay", type=float, default=None,
+                        help="Delay per W[t] line (overrides --delay).")
+    parser.add_argument("--round-delay", type=float, default=None,
+                        help="Delay per round printed (overrides --delay).")
+    parser.add_argument("--step", action="store_true",
+                        help="Pause for Enter between major sections.")
+    parser.add_argument("--total-duration", type=float, default=None, metavar="SECONDS",
+                        help="Fit the walkthrough or --diff to exactly SECONDS: the delays become relative "
+                             "weights and every line gets a deadline on the monotonic clock.")
+    parser.add_argument("--section-budget", action="append", default=[], metavar="NAME=SECONDS",
+                        help="Give one section (a header title such as Preprocessing, 'Block 0' or Result) "
+                             "a fixed duration; repeatable, combines with --total-duration.")
+    parser.add_argument("--record", default=None, metavar="FILE",
+                        help="Write the paced walkthrough (or --diff) to FILE as an asciinema v2 recording, "
+                             "timed on a virtual clock instead of sleeping.")
+    parser.add_argument("--record-size", default="120x36", metavar="COLSxROWS",
+                        help="Terminal size stored in the --record file (default: 120x36).")
+    parser.add_argument("--trace-out", default=None, metavar="FILE",
+                        help="Also write the traced rounds as a compact binary, mmap-able trace file.")
+    parser.add_argument("--no-pipeline", action="store_true",
+                        help="Compute on the rendering thread instead of a background producer.")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="Max events the producer may run ahead of the renderer (default: 4).")
+
+    # profiling
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="Write per-stage/per-block timings of the walkthrough as JSON to FILE ('-' for stderr).")
+    parser.add_argument("--cprofile", default=None, metavar="FILE",
+                        help="Also dump cProfile stats of the walkthrough to FILE.")
+
+    args = parser.parse_args()
+
+    global USE_RICH
+    if args.plain:
+        USE_RICH = False
+
+    try:
+        blocks = None if args.blocks == "all" else parse_index_spec(args.blocks)
+        rounds = parse_rounds_arg(args.rounds)
+    except ValueError as exc:
+        parser.error(str(exc))
+    budgets = {}
+    for spec in args.section_budget:
+        name, _, seconds = spec.rpartition("=")
+        try:
+            budgets[name.strip()] = float(seconds)
+        except ValueError:
+            parser.error(f"--section-budget expects NAME=SECONDS, got {spec!r}")
+        if not name.strip() or budgets[name.strip()] < 0:
+            parser.error(f"--section-budget expects NAME=SECONDS, got {spec!r}")
+    size = re.fullmatch(r"(\d+)x(\d+)", args.record_size)
+    if size is None or 0 in (int(size.group(1)), int(size.group(2))):
+        parser.error("--record-size expects COLSxROWS, e.g. 120x36")
+    timed = args.total_duration is not None or budgets or args.record
+    if timed:
+        if args.step:
+            parser.error("--step cannot be combined with --total-duration, --section-budget or --record")
+        if args.total_duration is not None and args.total_duration < 0:
+            parser.error("--total-duration must be at least 0")
+        other_modes = (args.file, args.compare_algos, args.batch, args.numpy_check, args.pbkdf2, args.hmac,
+                       args.length_extension, args.serve)
+        if args.stdin or args.tree or any(x is not None for x in other_modes):
+            parser.error("--total-duration, --section-budget and --record apply to the message walkthrough and --diff")
+
+    def on_timeline(render):
+        if args.record is None:
+            run_on_timeline(render, args.total_duration, budgets)
+            return
+        start = time.perf_counter()
+        duration = record_asciicast(args.record, render, args.total_duration, budgets,
+                                    int(size.group(1)), int(size.group(2)), "hash_demo.py " + " ".join(sys.argv[1:]))
+        print(f"recorded {duration:.3f} s of output to {args.record} in {time.perf_counter() - start:.3f} s",
+              file=sys.stderr)
+
+    if args.serve is not None:
+        run_serve(args)
+        return
+
+    if args.compare_algos is not None:
+        if args.compare_algos < 1:
+            parser.error("--compare-algos needs at least 1 byte")
+        run_compare_algos(args.compare_algos, args.delay)
+        return
+
+    if args.algo != "sha256" and any(v is not None for v in (args.numpy_check, args.batch,
+                                                               args.hmac, args.pbkdf2)):
+        parser.error("--numpy-check, --batch, --hmac and --pbkdf2 only support --algo sha256")
+
+    if args.pbkdf2 is not None:
+        if args.iterations < 1 or args.dklen < 1:
+            parser.error("--iterations and --dklen must be at least 1")
+        try:
+            run_pbkdf2(args)
+        except ValueError as exc:
+            parser.error(f"--salt: {exc}")
+        return
+
+    if args.diff is not None:
+        if args.message is not None:
+            parser.error("--diff takes its own two inputs; drop the message argument")
+        if args.from_block < 0:
+            parser.error("--from-block must be at least 0")
+        try:
+            on_timeline(lambda: run_diff(args, rounds))
+        except OSError as exc:
+            parser.error(f"--diff: {exc}")
+        return
+
+    if args.numpy_check is not None:
+        run_numpy_check(args.numpy_check, args.delay)
+        return
+
+    if args.batch is not None:
+        try:
+            run_batch(args)
+        except OSError as exc:
+            parser.error(f"--batch: {exc}")
+        return
+
+    if args.tree:
+        if args.file is None:
+            parser.error("--tree needs --file (leaves are read at their offsets)")
+        if args.algo != "sha256":
+            parser.error("--tree only supports --algo sha256")
+        try:
+            run_tree(args)
+        except OSError as exc:
+            parser.error(f"--tree: {exc}")
+        return
+
+    if args.file is not None or args.stdin:
+        if args.message is not None or (args.file is not None and args.stdin):
+            parser.error("message, --file and --stdin are mutually exclusive")
+        try:
+            run_stream(args, blocks, rounds)
+        except OSError as exc:
+            parser.error(f"{'--file' if args.file is not None else '--stdin'}: {exc}")
+        return
+
+    msg = args.message
+    if msg is None:
+        try:
+            if _use_rich():
+                console.print(Panel.fit("Enter the message to hash:", title="Input"))
+                msg = input("> ")
+            else:
+                msg = input("Enter the message to hash: ")
+        except KeyboardInterrupt:
+            return
+
+    if args.length_extension is not None:
+        run_length_extension(args, msg)
+        return
+
+    if args.hmac is not None:
+        run_hmac(args, msg)
+        return
+
+    global _PROFILER
+    if args.profile is None and args.cprofile is None:
+        on_timeline(lambda: run_message(args, msg, blocks, rounds))
+        return
+
+    _PROFILER = StageProfiler() if args.profile is not None else None
+    import cProfile
+    cprof = cProfile.Profile() if args.cprofile is not None else None
+    if cprof is not None:
+        cprof.enable()
+    try:
+        on_timeline(lambda: run_message(args, msg, blocks, rounds))
+    finally:
+        if cprof is not None:
+            cprof.disable()
+            cprof.dump_stats(args.cprofile)
+        if _PROFILER is not None:
+            report = json.dumps(_PROFILER.to_dict(), indent=2)
+            _PROFILER = None
+            if args.profile == "-":
+                print(report, file=sys.stderr)
+            else:
+                with open(args.profile, "w", encoding="utf-8") as fh:
+                    fh.write(report + "\n")
+
+def run_message(args, msg: str, blocks: List[int], rounds: List[int]):
+    # Effective per-line delays
+    schedule_delay = args.schedule_delay if args.schedule_delay is not None else args.delay
+    round_delay = args.round_delay if args.round_delay is not None else args.delay
+
+    variant = SHA2_VARIANTS[args.algo]
+    rounds = resolve_indices(rounds, variant.rounds)
+    bs = variant.block_size
+    data = msg.encode("utf-8")
+    block_count = block_count_for(len(data), variant)
+    if _PROFILER is not None:
+        # the profiler is single-threaded, so profiled runs stay on this thread
+        # (and are not replayed: the planning run is not profiled)
+        events = iter_block_events(data, blocks=blocks, rounds=rounds, variant=variant, profiler=_PROFILER)
+    else:
+        events = timeline_events("blocks", lambda: iter_block_events(data, blocks=blocks, rounds=rounds,
+                                                                     variant=variant))
+        if not args.no_pipeline:
+            events = EventPipeline(events, args.queue_size)
+
+    # Header
+    print_header(f"{variant.name} Step-by-Step", args.delay)
+    print_kv("Input", [
+        ("Text", repr(msg)),
+        ("Bytes (hex)", data.hex()),
+        ("Bit length", f"{len(data)*8} bits"),
+    ], delay=args.delay, step=args.step)
+
+    # Preprocessing
+    print_header("Preprocessing", args.delay)
+    with (_PROFILER.stage if _PROFILER is not None else _no_stage)("padding"):
+        padded_hex = data.hex() + sha2_padding(len(data), variant).hex()
+    print_kv("Padding", [
+        ("Padded length (bits)", str(block_count * bs * 8)),
+        ("Padded (hex)", padded_hex),
+    ], delay=args.delay, step=args.step)
+    print_kv("Blocks", [
+        ("Count", str(block_count)),
+        ("Block size", f"{bs * 8} bits ({bs} bytes)"),
+    ], delay=args.delay, step=args.step)
+
+    # Selected block deep-dives, rendered as the engine reaches them
+    exported = []
+    for event in events:
+        if event["type"] == "digest":
+            ours = event["digest"]
+            break
+        if args.trace_out:
+            exported.append(event)
+        print_block_trace(event, args.delay, schedule_delay, round_delay,
+                          args.schedule_limit, args.no_schedule, args.step)
+
+    # Final digest + verification
+    print_header("Result", args.delay)
+    reference = reference_hash(variant)
+    theirs = None
+    if reference is not None:
+        reference.update(data)
+        theirs = reference.hexdigest()
+    print_kv("Digest", [
+        ("Computed (this script)", ours),
+        (f"hashlib.{variant.hashlib_name}", theirs or "unavailable"),
+        ("Verification", _verdict(ours, theirs)),
+    ] + _export_trace(args.trace_out, exported), delay=args.delay, step=False)
+
+    if _use_rich():
+        console.print(Rule())
+        console.print(
+            "[dim]Tips:[/dim] "
+            "[bold]--delay 0.1[/bold] faster • "
+            "[bold]--step[/bold] for manual pauses • "
+            "[bold]--schedule-limit 64[/bold] to show full W"
+        )
+
+if __name__ == "__main__":
+    main()
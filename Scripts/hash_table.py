@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Salted credential-table hashing (the "User Database" scene, for real data)
+- Streams a users CSV (e.g. ID,Username,Password) and replaces the password column
+  with a salted hash; every row gets its own random salt.
+- Schemes: pbkdf2_sha256 (default) or a single salted sha256 (fast, demo only),
+  on hashlib or on the pure-Python hash_demo.py engine.
+- Rows are hashed across a process pool with a bounded number of chunks in flight,
+  and written in input order, so memory stays constant however large the table is.
+- A checkpoint file records how much input and output is committed; rerunning the
+  same command after a crash resumes from there instead of from row 0.
+"""
+
+import argparse
+import csv
+import hashlib
+import hmac
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import hash_demo as hd
+
+SCHEMES = ("pbkdf2_sha256", "sha256")
+SALT_BYTES = 16
+
+# --- Hashing -------------------------------------------------------------------
+def pbkdf2_engine(engine: str):
+    """derive(password, salt, iterations) for --engine, as used by hash_password."""
+    if engine == "python":
+        return hd.pbkdf2_hmac_sha256
+    return lambda password, salt, iterations: hashlib.pbkdf2_hmac("sha256", password, salt, iterations)
+
+def hash_password(password: bytes, scheme: str, iterations: int, engine: str = "hashlib",
+                  salt: bytes = None) -> str:
+    """Encode as "pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>" or "sha256$<salt hex>$<hash hex>"."""
+    if salt is None:
+        salt = os.urandom(SALT_BYTES)
+    if scheme == "pbkdf2_sha256":
+        dk = pbkdf2_engine(engine)(password, salt, iterations)
+        return f"pbkdf2_sha256${iterations}${salt.hex()}${dk.hex()}"
+    if engine == "python":
+        digest = hd.SHA256Hasher(salt + password).digest()
+    else:
+        digest = hashlib.sha256(salt + password).digest()
+    return f"sha256${salt.hex()}${digest.hex()}"
+
+def verify_password(encoded: str, password: bytes) -> bool:
+    parts = encoded.split("$")
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        expected = hash_password(password, parts[0], int(parts[1]), salt=bytes.fromhex(parts[2]))
+    elif parts[0] == "sha256" and len(parts) == 3:
+        expected = hash_password(password, parts[0], 0, salt=bytes.fromhex(parts[1]))
+    else:
+        raise ValueError(f"unknown hash encoding: {parts[0]!r}")
+    return hmac.compare_digest(expected, encoded)
+
+def _hash_rows(rows: List[List[str]], column: int, scheme: str, iterations: int,
+               engine: str) -> Tuple[bytes, int]:
+    """Worker: hash the password column of parsed rows, return (CSV bytes, skipped).
+
+    A row is skipped (never copied: it may hold a plaintext password) if it
+    has no password column or is not valid UTF-8; the rest of the chunk goes on.
+    """
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    skipped = 0
+    for row in rows:
+        try:
+            fields = [field.encode("utf-8") for field in row]  # rejects undecodable bytes
+            if len(row) <= column:
+                raise ValueError("no password column")
+        except ValueError:  # UnicodeEncodeError included
+            skipped += 1
+            continue
+        row[column] = hash_password(fields[column], scheme, iterations, engine)
+        writer.writerow(row)
+    return out.getvalue().encode("utf-8"), skipped
+
+# --- Input / checkpoint ----------------------------------------------------------
+def iter_row_chunks(fh, chunk_rows: int) -> Iterator[Tuple[List[List[str]], int, int]]:
+    """Yield (rows, input offset after them, unparsable rows) from a binary file at a row start.
+
+    Rows are csv.reader records, so a quoted field may span lines. Bytes that
+    are not UTF-8 are kept as surrogate escapes for the worker to reject.
+    """
+    offset = fh.tell()
+
+    def lines():
+        nonlocal offset
+        for line in fh:
+            offset += len(line)
+            yield line.decode("utf-8", "surrogateescape")
+
+    reader = csv.reader(lines())  # reads only as many lines as each record needs
+    chunk = []
+    bad = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error:
+            bad += 1
+            continue
+        if row:
+            chunk.append(row)
+        if len(chunk) + bad >= chunk_rows:
+            yield chunk, offset, bad
+            chunk, bad = [], 0
+    if chunk or bad:
+        yield chunk, offset, bad
+
+def resolve_column(header: List[str], spec: str) -> int:
+    if spec.isdigit():
+        return int(spec)
+    names = [name.strip().lower() for name in header]
+    if spec.lower() not in names:
+        raise SystemExit(f"no column named {spec!r} in header {header}")
+    return names.index(spec.lower())
+
+def load_checkpoint(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+def save_checkpoint(path: str, state: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+
+# --- Pipeline ----------------------------------------------------------------------
+def hash_table(args) -> dict:
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    state = load_checkpoint(checkpoint_path) if os.path.exists(checkpoint_path) else None
+    job = {"input": args.input, "scheme": args.scheme, "iterations": args.iterations,
+           "column": args.password_column}
+    if state is not None:
+        for key, value in job.items():
+            if state[key] != value:
+                raise SystemExit(f"{checkpoint_path}: {key} was {state[key]!r} for this job; "
+                                 f"remove the checkpoint to start over")
+
+    fin = open(args.input, "rb")
+    fout = open(args.output, "r+b" if state is not None else "wb")
+    try:
+        if state is None:
+            if not args.no_header:
+                first = fin.readline()
+                header = next(csv.reader([first.decode("utf-8-sig")]))
+                column = resolve_column(header, args.password_column)
+                renamed = list(header)
+                renamed[column] = "Hash"
+                line = io.StringIO()
+                csv.writer(line, lineterminator="\n").writerow(renamed)
+                fout.write(line.getvalue().encode("utf-8"))
+            else:
+                column = resolve_column([], args.password_column)
+            state = dict(job, column_index=column, rows=0, skipped=0,
+                         input_offset=fin.tell(), output_offset=fout.tell())
+            resumed_rows = 0
+        else:
+            column = state["column_index"]
+            fin.seek(state["input_offset"])
+            fout.truncate(state["output_offset"])  # drop rows written after the last checkpoint
+            fout.seek(state["output_offset"])
+            resumed_rows = state["rows"]
+
+        workers = args.workers or os.cpu_count() or 1
+        jobs = (((len(rows), bad, end_offset), (rows, column, args.scheme, args.iterations, args.engine))
+                for rows, end_offset, bad in iter_row_chunks(fin, max(1, args.chunk_rows)))
+        last_save = time.perf_counter()
+        start = last_save
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # commit in input order so the checkpoint can be a pair of offsets
+            for (nrows, bad, end_offset), (data, skipped) in hd.bounded_map(pool, _hash_rows, jobs,
+                                                                              2 * workers, ordered=True):
+                fout.write(data)
+                state["rows"] += nrows - skipped
+                state["skipped"] += skipped + bad
+                state["input_offset"] = end_offset
+                state["output_offset"] = fout.tell()
+                now = time.perf_counter()
+                if now - last_save >= args.checkpoint_seconds:
+                    fout.flush()
+                    os.fsync(fout.fileno())
+                    save_checkpoint(checkpoint_path, state)
+                    last_save = now
+                    if args.progress:
+                        rate = (state["rows"] - resumed_rows) / (now - start)
+                        print(f"{state['rows']} rows ({rate:,.0f} rows/s)", file=sys.stderr)
+    finally:
+        fin.close()
+        fout.close()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)  # finished: nothing left to resume
+    elapsed = time.perf_counter() - start
+    state.update(resumed_rows=resumed_rows, seconds=elapsed, workers=workers)
+    return state
+
+# --- CLI -------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Hash the password column of a users CSV with per-user salts.")
+    parser.add_argument("input", nargs="?", help="Users CSV, e.g. ID,Username,Password.")
+    parser.add_argument("output", nargs="?", help="Output CSV; the password column becomes an encoded salted hash.")
+    parser.add_argument("--scheme", choices=SCHEMES, default="pbkdf2_sha256",
+                        help="pbkdf2_sha256 (default) or a single salted sha256 (fast; not for real passwords).")
+    parser.add_argument("--iterations", type=int, default=100000,
+                        help="PBKDF2 iterations (default: 100000; see --calibrate).")
+    parser.add_argument("--calibrate", type=float, default=None, metavar="SECONDS",
+                        help="Print the PBKDF2 iterations that take about SECONDS per password "
+                             "with the selected --engine on this machine, then exit.")
+    parser.add_argument("--engine", choices=("hashlib", "python"), default="hashlib",
+                        help="hashlib (default) or the pure-Python hash_demo.py engine.")
+    parser.add_argument("--password-column", default="password",
+                        help="Password column name (from the header) or 0-based index (default: password).")
+    parser.add_argument("--no-header", action="store_true",
+                        help="The input has no header row (give --password-column as an index).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count).")
+    parser.add_argument("--chunk-rows", type=int, default=64,
+                        help="Rows per task submitted to the pool (default: 64).")
+    parser.add_argument("--checkpoint", default=None, metavar="FILE",
+                        help="Checkpoint file (default: OUTPUT.checkpoint). Rerun the same command to resume.")
+    parser.add_argument("--checkpoint-seconds", type=float, default=5.0,
+                        help="Seconds between checkpoints (default: 5).")
+    parser.add_argument("--progress", action="store_true",
+                        help="Print rows and rows/s to stderr at every checkpoint.")
+    args = parser.parse_args()
+    if args.calibrate is not None:
+        if args.calibrate <= 0:
+            parser.error("--calibrate must be greater than 0")
+        iterations = hd.calibrate_pbkdf2(args.calibrate, derive=pbkdf2_engine(args.engine))
+        print(f"--iterations {iterations}  (≈ {args.calibrate:g} s per password, {args.engine} engine)")
+        return
+    if args.input is None or args.output is None:
+        parser.error("input and output are required (unless --calibrate)")
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+    if args.no_header and not args.password_column.isdigit():
+        parser.error("--no-header needs --password-column as a 0-based index")
+
+    result = hash_table(args)
+    hashed = result["rows"] - result["resumed_rows"]
+    rate = hashed / result["seconds"] if result["seconds"] > 0 else float("inf")
+    resumed = f", resumed after {result['resumed_rows']}" if result["resumed_rows"] else ""
+    print(f"{result['rows']} rows hashed{resumed} in {result['seconds']:.3f} s "
+          f"({rate:,.0f} rows/s, {result['workers']} workers, {args.scheme})", file=sys.stderr)
+    if result["skipped"]:
+        print(f"{result['skipped']} rows skipped (not UTF-8 or no password column)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()